@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# Re-derive metrics for every tripinfo/crashinfo file in an output directory.
+# Files are parsed in parallel and results are cached by file hash and mtime so only new or
+# changed files (or all of them after xml_parser.py changes) are parsed again.
+# With --archive, plain .xml outputs are gzip compressed once their metrics are in the cache.
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import concurrent.futures
+import csv
+import glob
+import gzip
+import hashlib
+import json
+import optparse
+import os
+import shutil
+import time
+import xml_parser
+
+TRIPINFO_SUFFIX = "simulation_tripinfo.xml"
+CRASHINFO_SUFFIX = "simulation_crashinfo.xml"
+
+
+def hashFile(fileName):
+    sha = hashlib.sha1()
+    with open(fileName, 'rb') as file:
+        while True:
+            block = file.read(1 << 20)
+            if not block:
+                break
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def parserVersion():
+    # Any change to the metric code invalidates the cache
+    return hashFile(xml_parser.__file__.replace(".pyc", ".py"))
+
+
+def analyzeFile(fileName, kind, knownHash=None, knownData=None):
+    # Runs in a worker process. A file that was only touched or copied keeps its cached result.
+    fileHash = hashFile(fileName)
+    if fileHash == knownHash:
+        return fileName, fileHash, knownData
+    if kind == "tripinfo":
+        result = xml_parser.SUMOOutputParser(fileName).returnParsedDataGoogleSheets()
+        data = {}
+        for name in xml_parser.RESULT_FIELDS + xml_parser.PERCENTILE_FIELDS:
+            data[name] = getattr(result, name)
+        # Kept so runs can be pooled later without parsing again
+        data["sketches"] = {name: sketch.state() for name, sketch in result.sketches.items()}
+        data["vehicleClasses"] = {}
+        for vehicleClass, classResult in result.vehicleClasses.items():
+            data["vehicleClasses"][vehicleClass] = {}
+            for name in xml_parser.RESULT_FIELDS + xml_parser.PERCENTILE_FIELDS:
+                data["vehicleClasses"][vehicleClass][name] = getattr(classResult, name)
+    else:
+        data = xml_parser.CollisionOutputParser(fileName).returnParsedDataBreakdown()
+        # JSON keys have to be strings
+        data["byTimeBucket"] = {str(bucket): count for bucket, count in data["byTimeBucket"].items()}
+    return fileName, fileHash, data
+
+
+def findOutputFiles(directory):
+    files = []
+    for suffix, kind in [(TRIPINFO_SUFFIX, "tripinfo"), (CRASHINFO_SUFFIX, "crashinfo")]:
+        for fileName in sorted(glob.glob(os.path.join(directory, "*" + suffix)) + glob.glob(os.path.join(directory, "*" + suffix + ".gz"))):
+            files.append((fileName, kind))
+    return files
+
+
+def returnRunName(fileName):
+    baseName = os.path.basename(fileName)
+    if baseName.endswith(".gz"):
+        baseName = baseName[:-len(".gz")]
+    for suffix in [TRIPINFO_SUFFIX, CRASHINFO_SUFFIX]:
+        if baseName.endswith(suffix):
+            return baseName[:-len(suffix)]
+    return baseName
+
+
+def archiveOutputFiles(results):
+    # Compress plain outputs we already have metrics for and carry their cache entry over to the .gz file
+    archived = {}
+    for fileName, entry in results.items():
+        if fileName.endswith(".gz"):
+            archived[fileName] = entry
+            continue
+        archiveFileName = fileName + ".gz"
+        with open(fileName, 'rb') as source, gzip.open(archiveFileName, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.remove(fileName)
+        stat = os.stat(archiveFileName)
+        archived[archiveFileName] = {"kind": entry["kind"], "size": stat.st_size, "mtime": stat.st_mtime, "hash": hashFile(archiveFileName), "data": entry["data"]}
+        print ( " archived ", fileName )
+    return archived
+
+
+def loadCache(cacheFileName, version):
+    if not os.path.exists(cacheFileName):
+        return {}
+    try:
+        with open(cacheFileName, 'r') as file:
+            cache = json.load(file)
+    except Exception as e:
+        print ( "Cache unreadable, starting over ", str(e) )
+        return {}
+    if cache.get("version") != version:
+        print ( "xml_parser changed since the cache was written, re-parsing everything" )
+        return {}
+    return cache.get("files", {})
+
+
+def saveCache(cacheFileName, version, files):
+    tempFileName = cacheFileName + ".tmp"
+    with open(tempFileName, 'w') as file:
+        json.dump({"version": version, "files": files}, file)
+    os.replace(tempFileName, cacheFileName)
+
+
+def analyzeDirectory(directory, cacheFileName, processes=None, archive=False):
+    version = parserVersion()
+    cache = loadCache(cacheFileName, version)
+    files = findOutputFiles(directory)
+
+    results = {}
+    pending = []
+    for fileName, kind in files:
+        stat = os.stat(fileName)
+        entry = cache.get(fileName)
+        if entry != None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            results[fileName] = entry
+        else:
+            pending.append((fileName, kind, stat, entry))
+
+    print ( "Files found: ", len(files), " cached: ", len(results), " to parse: ", len(pending) )
+
+    startTime = time.time()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {}
+        for fileName, kind, stat, entry in pending:
+            if entry != None:
+                future = executor.submit(analyzeFile, fileName, kind, entry["hash"], entry["data"])
+            else:
+                future = executor.submit(analyzeFile, fileName, kind)
+            futures[future] = (fileName, kind, stat)
+        for count, future in enumerate(concurrent.futures.as_completed(futures)):
+            fileName, kind, stat = futures[future]
+            try:
+                fileName, fileHash, data = future.result()
+            except Exception as e:
+                print ( "Could not parse ", fileName, " ", str(e) )
+                continue
+            results[fileName] = {"kind": kind, "size": stat.st_size, "mtime": stat.st_mtime, "hash": fileHash, "data": data}
+            print ( " parsed ", count + 1, "/", len(pending), " ", fileName )
+
+    print ( "Parsing took (seconds): ", time.time() - startTime )
+    if archive:
+        results = archiveOutputFiles(results)
+    saveCache(cacheFileName, version, results)
+    return results
+
+
+def writeCombinedTable(results, tableFileName):
+    # One row per run, tripinfo metrics (overall and per class) next to the collision count of the same run
+    runs = {}
+    for fileName, entry in results.items():
+        runs.setdefault(returnRunName(fileName), {})[entry["kind"]] = entry["data"]
+
+    header = ["run"] + xml_parser.RESULT_FIELDS
+    for vehicleClass in xml_parser.VEHICLE_CLASSES:
+        header = header + [vehicleClass + "_" + name for name in xml_parser.RESULT_FIELDS]
+    header = header + ["collisions"] + xml_parser.PERCENTILE_FIELDS
+
+    with open(tableFileName, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for runName in sorted(runs):
+            tripinfo = runs[runName].get("tripinfo")
+            crashinfo = runs[runName].get("crashinfo")
+            row = [runName]
+            if tripinfo != None:
+                row = row + [tripinfo[name] for name in xml_parser.RESULT_FIELDS]
+                for vehicleClass in xml_parser.VEHICLE_CLASSES:
+                    classData = tripinfo["vehicleClasses"].get(vehicleClass, {})
+                    row = row + [classData.get(name, "") for name in xml_parser.RESULT_FIELDS]
+            else:
+                row = row + [""] * (len(header) - 2 - len(xml_parser.PERCENTILE_FIELDS))
+            row.append(crashinfo["totalCollisions"] if crashinfo != None else "")
+            # Percentiles of the run, see xml_parser.PERCENTILE_FIELDS
+            row = row + [tripinfo.get(name, "") if tripinfo != None else "" for name in xml_parser.PERCENTILE_FIELDS]
+            writer.writerow(row)
+    print ( "Combined table written to ", tableFileName, " runs: ", len(runs) )
+
+
+def get_options():
+    optParser = optparse.OptionParser()
+    optParser.add_option("--directory", type="string", dest="directory", default="../output/", help="Directory holding the tripinfo and crashinfo files")
+    optParser.add_option("--table", type="string", dest="table", default="../output/batch_analysis.csv", help="Combined csv table to write")
+    optParser.add_option("--cache", type="string", dest="cache", default="../output/batch_analysis_cache.json", help="Per file result cache")
+    optParser.add_option("--archive", action="store_true", default=False, help="gzip plain xml outputs once their metrics are cached")
+    optParser.add_option("--processes", type="int", dest="processes", default=None, help="Number of parser processes, defaults to the number of cores")
+    options, args = optParser.parse_args()
+    return options
+
+
+# this is the main entry point of this script
+if __name__ == "__main__":
+    options = get_options()
+    results = analyzeDirectory(options.directory, options.cache, options.processes, options.archive)
+    writeCombinedTable(results, options.table)
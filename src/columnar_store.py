@@ -0,0 +1,121 @@
+from filelock import FileLock
+import json
+import os
+import numpy
+
+
+class ColumnarResultStore:
+    def __init__(self, directory):
+        # One raw binary file per column plus index.json holding the row count and column types.
+        # Numbers are float64 (NaN when missing), text columns are int32 codes into a dictionary.
+        self.directory = directory
+        self.indexFileName = os.path.join(directory, "index.json")
+        self.lock = FileLock(os.path.normpath(directory) + ".lock")
+
+    def columnFileName(self, name):
+        return os.path.join(self.directory, name + ".bin")
+
+    def readIndex(self):
+        if not os.path.exists(self.indexFileName):
+            return {"rows": 0, "columns": {}, "order": []}
+        with open(self.indexFileName, 'r') as file:
+            return json.load(file)
+
+    def writeIndex(self, index):
+        tempFileName = self.indexFileName + ".tmp"
+        with open(tempFileName, 'w') as file:
+            json.dump(index, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tempFileName, self.indexFileName)
+
+    def append(self, row):
+        # row is a dict of column name to value, columns we have not seen before are back filled as missing
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            index = self.readIndex()
+            rows = index["rows"]
+
+            for name, value in row.items():
+                if name not in index["columns"]:
+                    if isinstance(value, str) and self.toFloat(value) == None:
+                        index["columns"][name] = {"dtype": "int32", "dictionary": []}
+                    else:
+                        index["columns"][name] = {"dtype": "float64", "dictionary": None}
+                    index["order"].append(name)
+                    self.writeColumn(name, index["columns"][name], [None] * rows, 0)
+
+            for name in index["order"]:
+                self.writeColumn(name, index["columns"][name], [row.get(name)], rows)
+
+            # The row only exists once the index says so, a crash before this point is cut off on the next append
+            index["rows"] = rows + 1
+            self.writeIndex(index)
+
+    def writeColumn(self, name, column, values, rows):
+        dtype = numpy.dtype(column["dtype"])
+        if column["dictionary"] != None:
+            data = numpy.array([self.encode(column, value) for value in values], dtype=dtype)
+        else:
+            # None comes out as NaN
+            data = numpy.array([self.toFloat(value) for value in values], dtype=numpy.float64)
+
+        fileName = self.columnFileName(name)
+        with open(fileName, 'ab') as file:
+            # Drop anything a crashed writer left past the committed rows
+            if file.tell() != rows * dtype.itemsize:
+                file.truncate(rows * dtype.itemsize)
+            file.write(data.tobytes())
+
+    def encode(self, column, value):
+        if value == None:
+            return -1
+        value = str(value)
+        if value not in column["dictionary"]:
+            column["dictionary"].append(value)
+        return column["dictionary"].index(value)
+
+    def toFloat(self, value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    def columnNames(self):
+        return self.readIndex()["order"]
+
+    def column(self, name, index=None):
+        # Memory mapped, nothing is read until the array is touched
+        if index == None:
+            index = self.readIndex()
+        column = index["columns"][name]
+        dtype = numpy.dtype(column["dtype"])
+        if index["rows"] == 0:
+            return numpy.empty(0, dtype=dtype)
+        return numpy.memmap(self.columnFileName(name), dtype=dtype, mode='r', shape=(index["rows"],))
+
+    def load(self, columns=None, where=None):
+        # where maps a column name to a value or a list of allowed values, e.g. {"mapname": "tempe_2x3", "avProbability": [0.1, 0.2]}
+        index = self.readIndex()
+        if columns == None:
+            columns = index["order"]
+
+        mask = numpy.ones(index["rows"], dtype=bool)
+        if where != None:
+            for name, allowed in where.items():
+                if not isinstance(allowed, (list, tuple)):
+                    allowed = [allowed]
+                column = index["columns"][name]
+                if column["dictionary"] != None:
+                    allowed = [column["dictionary"].index(str(value)) for value in allowed if str(value) in column["dictionary"]]
+                mask = mask & numpy.isin(self.column(name, index), allowed)
+
+        result = {}
+        for name in columns:
+            data = self.column(name, index)[mask]
+            dictionary = index["columns"][name]["dictionary"]
+            if dictionary != None:
+                # Code -1 (missing) lands on the trailing None
+                data = numpy.array(dictionary + [None], dtype=object)[data]
+            result[name] = data
+        return result
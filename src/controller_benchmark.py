@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# Benchmark the controller loop in runner_atlas_simulation.run() without SUMO.
+# run() is driven by a fake TraCI connection that keeps a synthetic fleet of a fixed size, so the
+# time between two simulationStep calls is the controller's own time. Reported per active vehicle
+# count and AV/CAV penetration, together with the TraCI calls a step makes (each one is a socket
+# round trip against a real SUMO).
+#
+# python controller_benchmark.py --vehicles 100,500,1000 --penetrations 0:0,0.2:0.2,0.1:0.6 --steps 50
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import contextlib
+import json
+import optparse
+import os
+import random
+import sys
+import time
+
+# The runner refuses to load without SUMO_HOME, the fake connection does not need SUMO itself
+if 'SUMO_HOME' not in os.environ:
+    os.environ['SUMO_HOME'] = os.path.dirname(os.path.abspath(__file__))
+
+import input_output_parsing  # noqa
+import runner_atlas_simulation  # noqa
+
+# Vehicles per lane, the first one of every lane has no leader
+LANE_LENGTH = 20
+
+
+class FakeVehicleDomain:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def getIDList(self):
+        self.connection.calls += 1
+        return tuple(self.connection.active)
+
+    def getSpeed(self, vehicleID):
+        self.connection.calls += 1
+        return self.connection.speeds[vehicleID]
+
+    def getEmergencyDecel(self, vehicleID):
+        self.connection.calls += 1
+        return 9.0
+
+    def getLeader(self, vehicleID, dist=0.0):
+        self.connection.calls += 1
+        idx = self.connection.index[vehicleID]
+        if idx % LANE_LENGTH == 0:
+            return None
+        return (self.connection.active[idx - 1], self.connection.gaps[vehicleID])
+
+    def setTau(self, vehicleID, tau):
+        self.connection.calls += 1
+        self.connection.taus[vehicleID] = tau
+
+    def setType(self, vehicleID, typeID):
+        self.connection.calls += 1
+        self.connection.types[vehicleID] = typeID
+
+
+class FakeSimulationDomain:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def getMinExpectedNumber(self):
+        self.connection.calls += 1
+        if self.connection.step >= self.connection.steps:
+            return 0
+        return len(self.connection.active)
+
+
+class FakeConnection:
+    def __init__(self, activeVehicles, steps, turnover=0.02, seed=42):
+        # A fleet of activeVehicles where turnover of them arrive every step and are replaced by new ones
+        self.random = random.Random(seed)
+        self.steps = steps
+        self.step = 0
+        self.turnover = turnover
+        self.calls = 0
+        self.nextID = 0
+        self.active = []
+        self.speeds = {}
+        self.gaps = {}
+        self.taus = {}
+        self.types = {}
+        self.vehicle = FakeVehicleDomain(self)
+        self.simulation = FakeSimulationDomain(self)
+        for count in range(activeVehicles):
+            self.depart()
+        self.updateIndex()
+
+        # Controller time is the gap between leaving one simulationStep and entering the next
+        self.stepTimes = []
+        self.stepCalls = []
+        self.lastStepEnd = None
+        self.lastCalls = 0
+
+    def depart(self):
+        vehicleID = "veh" + str(self.nextID)
+        self.nextID += 1
+        self.active.append(vehicleID)
+        self.speeds[vehicleID] = self.random.uniform(0.0, 30.0)
+        self.gaps[vehicleID] = self.random.uniform(2.0, 100.0)
+
+    def arrive(self, vehicleID):
+        del self.speeds[vehicleID]
+        del self.gaps[vehicleID]
+        self.taus.pop(vehicleID, None)
+        self.types.pop(vehicleID, None)
+
+    def updateIndex(self):
+        self.index = {vehicleID: idx for idx, vehicleID in enumerate(self.active)}
+
+    def simulationStep(self, step=0.0):
+        now = time.perf_counter()
+        if self.lastStepEnd != None:
+            self.stepTimes.append(now - self.lastStepEnd)
+            self.stepCalls.append(self.calls - self.lastCalls)
+
+        self.step += 1
+        arrivals = int(round(len(self.active) * self.turnover))
+        for vehicleID in self.active[:arrivals]:
+            self.arrive(vehicleID)
+        self.active = self.active[arrivals:]
+        for count in range(arrivals):
+            self.depart()
+        for vehicleID in self.active:
+            self.speeds[vehicleID] = min(30.0, max(0.0, self.speeds[vehicleID] + self.random.uniform(-1.0, 1.0)))
+        self.updateIndex()
+
+        self.lastCalls = self.calls
+        self.lastStepEnd = time.perf_counter()
+
+
+class BenchmarkTestContainer(input_output_parsing.ATLASTestContainer):
+    def __init__(self, avProbability, cavProbability, trafficSet):
+        input_output_parsing.ATLASTestContainer.__init__(self, 0)
+        self.mapname = "benchmark"
+        self.avProbability = avProbability
+        self.cavProbability = cavProbability
+        self.trafficSet = trafficSet
+
+    def writeThreadUpdateSheets(self, fileName, timestamp, step):
+        # No thread sheet while benchmarking
+        return
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def runCase(activeVehicles, avProbability, cavProbability, trafficSet, steps, turnover):
+    connection = FakeConnection(activeVehicles, steps, turnover)
+    container = BenchmarkTestContainer(avProbability, cavProbability, trafficSet)
+    # run() prints every step and vehicle, that output is not what we are measuring
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        startTime = time.perf_counter()
+        runner_atlas_simulation.run(connection, container, None)
+        seconds = time.perf_counter() - startTime
+
+    # The first step assigns types to the whole starting fleet, it is reported on its own
+    steadyTimes = connection.stepTimes[1:]
+    return {"activeVehicles": activeVehicles, "avProbability": avProbability, "cavProbability": cavProbability,
+            "trafficSet": trafficSet, "steps": steps, "seconds": seconds,
+            "firstStepMicroseconds": connection.stepTimes[0] * 1e6 if len(connection.stepTimes) > 0 else None,
+            "medianStepMicroseconds": percentile(steadyTimes, 0.5) * 1e6,
+            "p95StepMicroseconds": percentile(steadyTimes, 0.95) * 1e6,
+            "meanStepMicroseconds": sum(steadyTimes) / len(steadyTimes) * 1e6,
+            "traciCallsPerStep": sum(connection.stepCalls[1:]) / len(steadyTimes)}
+
+
+def get_options():
+    optParser = optparse.OptionParser()
+    optParser.add_option("--vehicles", type="string", dest="vehicles", default="100,500,1000,2000", help="Comma separated active vehicle counts")
+    optParser.add_option("--penetrations", type="string", dest="penetrations", default="0:0,0.2:0,0:0.2,0.2:0.2,0.1:0.6", help="Comma separated avProbability:cavProbability pairs")
+    optParser.add_option("--steps", type="int", dest="steps", default=50, help="Simulation steps per case")
+    optParser.add_option("--turnover", type="float", dest="turnover", default=0.02, help="Share of the fleet replaced every step")
+    optParser.add_option("--traffic_set", type="int", dest="traffic_set", default=0, help="trafficSet of the test, 1 uses the conservative AV type without the car following changes")
+    optParser.add_option("--output", type="string", dest="output", default="../output/controller_benchmark.json", help="JSON file the results are written to")
+    options, args = optParser.parse_args()
+    return options
+
+
+# this is the main entry point of this script
+if __name__ == "__main__":
+    options = get_options()
+
+    cases = []
+    for activeVehicles in [int(count) for count in options.vehicles.split(",")]:
+        for penetration in options.penetrations.split(","):
+            avProbability, cavProbability = [float(value) for value in penetration.split(":")]
+            cases.append(runCase(activeVehicles, avProbability, cavProbability, options.traffic_set, options.steps, options.turnover))
+            case = cases[-1]
+            print ( "vehicles: ", activeVehicles, " AV: ", avProbability, " CAV: ", cavProbability,
+                    " median us/step: ", int(case["medianStepMicroseconds"]), " p95 us/step: ", int(case["p95StepMicroseconds"]),
+                    " first step us: ", int(case["firstStepMicroseconds"]), " TraCI calls/step: ", round(case["traciCallsPerStep"], 1) )
+
+    os.makedirs(os.path.dirname(os.path.abspath(options.output)), exist_ok=True)
+    with open(options.output, 'w') as file:
+        json.dump({"python": sys.version.split()[0], "platform": sys.platform, "timestamp": time.time(), "cases": cases}, file, indent=1)
+    print ( "Results written to ", options.output )
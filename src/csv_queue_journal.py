@@ -0,0 +1,194 @@
+from filelock import FileLock
+import csv
+import json
+import os
+
+
+class CSVQueueJournal:
+    def __init__(self, filename, expectedLength=9, compactEvery=1000):
+        # The CSV spec is never rewritten, the counters live in a snapshot plus an append only journal
+        self.filename = filename
+        self.expectedLength = expectedLength
+        self.compactEvery = compactEvery
+        self.snapshotFileName = filename + ".snapshot.json"
+        self.lock = FileLock(filename + ".lock")
+
+        # Spec rows as read from the CSV, reloaded only when the CSV changes
+        self.inputList = None
+        self.specMtime = None
+
+        # Counter state rebuilt from snapshot + journal
+        self.generation = -1
+        self.loadedSnapshot = None
+        self.offset = 0
+        self.entries = 0
+        self.remaining = []
+        self.working = []
+        # Counters the spec had at the last reset and the parameters of every test, to carry progress over spec edits
+        self.initial = []
+        self.tests = []
+
+    def journalFileName(self, generation):
+        return self.filename + "." + str(generation) + ".journal"
+
+    def readSpec(self):
+        specMtime = os.stat(self.filename).st_mtime_ns
+        if self.inputList == None or specMtime != self.specMtime:
+            with open(self.filename, 'r') as file:
+                reader = csv.reader(file)
+                self.inputList = list(reader)
+            self.specMtime = specMtime
+        return self.inputList
+
+    def claim(self, processID, previousIdx):
+        # Finish our previous test and claim the next one with a single append
+        with self.lock:
+            self.catchUp()
+
+            testIdx = -1
+            # The first row contains the iterations left to complete
+            for idx in range(1, len(self.remaining)):
+                if self.remaining[idx] > 0:
+                    testIdx = idx
+                    break
+
+            lines = ""
+            if previousIdx != -1:
+                lines += "done," + str(processID) + "," + str(previousIdx) + "\n"
+            if testIdx != -1:
+                lines += "claim," + str(processID) + "," + str(testIdx) + "\n"
+            if len(lines) > 0:
+                self.append(lines)
+
+            if self.entries >= self.compactEvery:
+                self.compact()
+
+        return testIdx
+
+    def catchUp(self):
+        # Must hold the lock. Pick up whatever the other workers appended since our last look.
+        inputList = self.readSpec()
+        if not os.path.exists(self.snapshotFileName):
+            self.reset(inputList)
+        currentSnapshot = self.snapshotVersion()
+        if currentSnapshot != self.loadedSnapshot:
+            self.loadSnapshot()
+        self.readJournal()
+
+        # Checked on every call, a worker that is already running has to see a hand edit of the spec too
+        if self.specMtime != self.snapshotSpecMtime:
+            print ( "Test spec changed, rebuilding queue snapshot" )
+            self.reset(inputList)
+            self.loadSnapshot()
+
+    def readJournal(self):
+        journalFileName = self.journalFileName(self.generation)
+        if not os.path.exists(journalFileName):
+            return
+        with open(journalFileName, 'rb') as file:
+            file.seek(self.offset)
+            tail = file.read()
+
+        end = tail.rfind(b"\n") + 1
+        if end < len(tail):
+            # A worker died half way through an append, drop the partial line
+            print ( "Dropping partial journal entry" )
+            with open(journalFileName, 'r+b') as file:
+                file.truncate(self.offset + end)
+
+        for line in tail[:end].decode().splitlines():
+            self.apply(line)
+        self.offset = self.offset + end
+
+    def apply(self, line):
+        entry = line.split(",")
+        if len(entry) != 3:
+            return
+        idx = int(entry[2])
+        if idx >= len(self.remaining):
+            return
+        if entry[0] == "claim":
+            self.remaining[idx] = self.remaining[idx] - 1
+            self.working[idx] = self.working[idx] + 1
+        elif entry[0] == "done":
+            # A test finished after a spec edit may have moved, never count below zero
+            self.working[idx] = max(0, self.working[idx] - 1)
+        self.entries = self.entries + 1
+
+    def append(self, lines):
+        journalFileName = self.journalFileName(self.generation)
+        data = lines.encode()
+        with open(journalFileName, 'ab') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        for line in lines.splitlines():
+            self.apply(line)
+        self.offset = self.offset + len(data)
+
+    def returnTests(self, inputList):
+        # A test is identified by its parameters, i.e. every row of its column except the two counters
+        tests = [None]
+        for idx in range(1, len(inputList[0])):
+            tests.append([row[idx] if idx < len(row) else '' for rowIdx, row in enumerate(inputList)
+                          if rowIdx != 0 and rowIdx != self.expectedLength - 1])
+        return tests
+
+    def reset(self, inputList):
+        # Counters come from the spec, minus what was already claimed of tests that are still in it
+        initial = [0] + [int(x) for x in inputList[0][1:]]
+        remaining = list(initial)
+        working = [0] + [int(x) for x in inputList[self.expectedLength - 1][1:]]
+        tests = self.returnTests(inputList)
+        # Columns with the same parameters are matched in order, each new column takes at most one old one
+        columns = {}
+        for idx in range(1, len(tests)):
+            columns.setdefault(json.dumps(tests[idx]), []).append(idx)
+        for oldIdx in range(1, len(self.tests)):
+            candidates = columns.get(json.dumps(self.tests[oldIdx]), [])
+            if len(candidates) > 0:
+                idx = candidates.pop(0)
+                consumed = self.initial[oldIdx] - self.remaining[oldIdx]
+                remaining[idx] = max(0, initial[idx] - consumed)
+                working[idx] = self.working[oldIdx]
+        oldJournalFileName = self.journalFileName(self.generation)
+        self.writeSnapshot(self.generation + 1, remaining, working, self.specMtime, initial, tests)
+        if self.generation != -1 and os.path.exists(oldJournalFileName):
+            os.remove(oldJournalFileName)
+
+    def loadSnapshot(self):
+        with open(self.snapshotFileName, 'r') as file:
+            snapshot = json.load(file)
+        self.generation = snapshot["generation"]
+        self.remaining = snapshot["remaining"]
+        self.working = snapshot["working"]
+        self.snapshotSpecMtime = snapshot["specMtime"]
+        self.initial = snapshot.get("initial", list(self.remaining))
+        self.tests = snapshot.get("tests", [])
+        self.loadedSnapshot = self.snapshotVersion()
+        self.offset = 0
+        self.entries = 0
+
+    def snapshotVersion(self):
+        # Every snapshot is a fresh file moved into place, so inode and mtime together identify it
+        stat = os.stat(self.snapshotFileName)
+        return [stat.st_ino, stat.st_mtime_ns]
+
+    def compact(self):
+        # Must hold the lock. Fold the journal into a new snapshot and start an empty journal.
+        oldJournalFileName = self.journalFileName(self.generation)
+        self.writeSnapshot(self.generation + 1, self.remaining, self.working, self.snapshotSpecMtime, self.initial, self.tests)
+        self.loadSnapshot()
+        if os.path.exists(oldJournalFileName):
+            os.remove(oldJournalFileName)
+
+    def writeSnapshot(self, generation, remaining, working, specMtime, initial, tests):
+        # Start the new journal before the snapshot points at it
+        open(self.journalFileName(generation), 'wb').close()
+        tempFileName = self.snapshotFileName + ".tmp"
+        with open(tempFileName, 'w') as file:
+            json.dump({"generation": generation, "remaining": remaining, "working": working, "specMtime": specMtime,
+                       "initial": initial, "tests": tests}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tempFileName, self.snapshotFileName)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# Generate trip files of any size for the bundled maps to stress test run() and the parser.
+# Origin/destination pairs (and whether the trip starts at the fringe) are drawn from the map's own
+# osm.passenger.trips.xml, which randomTrips validated, so every generated trip is routable.
+# Trips are written a chunk at a time in departure order, nothing like a DOM is ever built.
+# A sumocfg pointing at the new trips is written next to osm.sumocfg.
+#
+# python demand_generator.py --map tempe_2x3 --vehicles 50000 --profile peak --end 3600
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import gzip
+import math
+import optparse
+import os
+import xml.etree.ElementTree as ET
+import numpy
+import xml_parser
+
+# Departure profiles, each maps a sorted fraction of the demand in [0, 1) to a fraction of the time window
+PROFILES = ["uniform", "ramp", "peak", "original"]
+
+# Trips written per chunk
+CHUNK_SIZE = 10000
+
+# Standard normal CDF tabulated on [-3, 3], inverted by interpolation for the peak profile
+NORMAL_GRID = numpy.linspace(-3.0, 3.0, 60001)
+NORMAL_CDF = numpy.array([0.5 * (1.0 + math.erf(x / math.sqrt(2.0))) for x in NORMAL_GRID.tolist()])
+
+
+def readTripPool(tripFileName):
+    # vType definitions as text plus the from/to pairs and departure times of the original demand
+    vTypes = []
+    for vType in xml_parser.iterElements(tripFileName, 'vType'):
+        vTypes.append(ET.tostring(vType, encoding='unicode').strip())
+
+    origins = []
+    destinations = []
+    fringe = []
+    departures = []
+    for trip in xml_parser.iterElements(tripFileName, 'trip'):
+        origins.append(trip.get('from'))
+        destinations.append(trip.get('to'))
+        fringe.append(trip.get('departSpeed') == "max")
+        departures.append(float(trip.get('depart')))
+    return vTypes, numpy.array(origins, dtype=object), numpy.array(destinations, dtype=object), numpy.array(fringe), numpy.sort(departures)
+
+
+def departureFractions(profile, positions, originalDepartures):
+    # positions are stratified and increasing, so the departure times come out sorted
+    if profile == "uniform":
+        return positions
+    if profile == "ramp":
+        # Demand grows linearly over the window
+        return numpy.sqrt(positions)
+    if profile == "peak":
+        # Normal shaped rush hour in the middle of the window, cut off at three sigma
+        low = NORMAL_CDF[0]
+        high = NORMAL_CDF[-1]
+        return (numpy.interp(low + positions * (high - low), NORMAL_CDF, NORMAL_GRID) + 3.0) / 6.0
+    if profile == "original":
+        # Same shape as the bundled demand, stretched over the window
+        quantiles = numpy.linspace(0.0, 1.0, len(originalDepartures))
+        span = originalDepartures[-1] - originalDepartures[0]
+        if span <= 0:
+            return positions
+        return (numpy.interp(positions, quantiles, originalDepartures) - originalDepartures[0]) / span
+    raise ValueError("Unknown departure profile " + profile)
+
+
+def openForWriting(fileName):
+    if fileName.endswith(".gz"):
+        return gzip.open(fileName, 'wt')
+    return open(fileName, 'w')
+
+
+def writeTrips(outputFileName, vTypes, origins, destinations, fringe, originalDepartures, vehicles, profile, begin, end, seed):
+    generator = numpy.random.default_rng(seed)
+    with openForWriting(outputFileName) as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        file.write('<!-- generated by demand_generator.py: %d vehicles, profile %s, window %s-%s, seed %d -->\n' % (vehicles, profile, begin, end, seed))
+        file.write('<routes xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:noNamespaceSchemaLocation="http://sumo.dlr.de/xsd/routes_file.xsd">\n')
+        for vType in vTypes:
+            file.write('    ' + vType + '\n')
+
+        for start in range(0, vehicles, CHUNK_SIZE):
+            count = min(CHUNK_SIZE, vehicles - start)
+            positions = (numpy.arange(start, start + count) + generator.random(count)) / vehicles
+            departures = begin + departureFractions(profile, positions, originalDepartures) * (end - begin)
+            picks = generator.integers(0, len(origins), count)
+            lines = []
+            for idx in range(count):
+                pick = picks[idx]
+                lines.append('    <trip id="veh%d" type="veh_passenger" depart="%.2f" departLane="best"%s from="%s" to="%s"/>\n'
+                             % (start + idx, departures[idx], ' departSpeed="max"' if fringe[pick] else '', origins[pick], destinations[pick]))
+            file.write("".join(lines))
+        file.write('</routes>\n')
+
+
+def writeConfig(mapDirectory, configFileName, tripFileName):
+    # Copy of osm.sumocfg with the generated trips as the route file
+    tree = ET.parse(os.path.join(mapDirectory, "osm.sumocfg"))
+    tree.getroot().find('input').find('route-files').set('value', os.path.basename(tripFileName))
+    tree.write(os.path.join(mapDirectory, configFileName), encoding='UTF-8', xml_declaration=True)
+
+
+def get_options():
+    optParser = optparse.OptionParser()
+    optParser.add_option("--map", type="string", dest="map", default="tempe_2x3", help="Map folder under ../maps/")
+    optParser.add_option("--vehicles", type="int", dest="vehicles", default=10000, help="Number of trips to generate")
+    optParser.add_option("--profile", type="string", dest="profile", default="uniform", help="Departure profile, one of " + ", ".join(PROFILES))
+    optParser.add_option("--begin", type="float", dest="begin", default=0.0, help="First departure time (seconds)")
+    optParser.add_option("--end", type="float", dest="end", default=3600.0, help="Last departure time (seconds)")
+    optParser.add_option("--seed", type="int", dest="seed", default=42, help="Seed of the generator")
+    optParser.add_option("--name", type="string", dest="name", default=None, help="Name of the demand, defaults to synthetic_<vehicles>_<profile>")
+    optParser.add_option("--gzip", action="store_true", default=False, help="Write the trips gzip compressed")
+    options, args = optParser.parse_args()
+    return options
+
+
+# this is the main entry point of this script
+if __name__ == "__main__":
+    options = get_options()
+    if options.profile not in PROFILES:
+        raise SystemExit("Unknown departure profile " + options.profile)
+
+    mapDirectory = os.path.join("../maps", options.map)
+    name = options.name if options.name != None else "synthetic_%d_%s" % (options.vehicles, options.profile)
+    tripFileName = os.path.join(mapDirectory, "osm." + name + ".trips.xml" + (".gz" if options.gzip else ""))
+    configFileName = "osm." + name + ".sumocfg"
+
+    vTypes, origins, destinations, fringe, originalDepartures = readTripPool(os.path.join(mapDirectory, "osm.passenger.trips.xml"))
+    print ( "Trip pool: ", len(origins), " origin/destination pairs, ", len(vTypes), " vTypes" )
+
+    writeTrips(tripFileName, vTypes, origins, destinations, fringe, originalDepartures,
+               options.vehicles, options.profile, options.begin, options.end, options.seed)
+    writeConfig(mapDirectory, configFileName, tripFileName)
+    print ( "Wrote ", tripFileName, " and ", os.path.join(mapDirectory, configFileName) )
@@ -2,11 +2,30 @@ from filelock import FileLock
 import csv
 import sys
 import time
-import statistics
-import operator
 import gspread
 import math
+import numpy
 from oauth2client.service_account import ServiceAccountCredentials
+from gspread.utils import rowcol_to_a1
+import spec_cache
+import csv_queue_journal
+import result_aggregator
+import columnar_store
+import xml_parser
+
+# Two sided 95% student t values indexed by degrees of freedom 1-30, index 0 is unused
+T_DISTRIBUTION_95 = numpy.array([0.0, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+                                 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+                                 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042])
+# Standard table rows above 30 degrees of freedom, 1/df = 0 is the normal limit
+T_DISTRIBUTION_95_INVERSE_DF = numpy.array([0.0, 1/120, 1/60, 1/40, 1/30])
+T_DISTRIBUTION_95_TAIL = numpy.array([1.960, 1.980, 2.000, 2.021, 2.042])
+
+def returnTValues95(degreesOfFreedom):
+    # Exact table up to 30, linear in 1/df between the standard rows above that
+    degreesOfFreedom = numpy.maximum(numpy.asarray(degreesOfFreedom), 1)
+    tail = numpy.interp(1.0 / degreesOfFreedom, T_DISTRIBUTION_95_INVERSE_DF, T_DISTRIBUTION_95_TAIL)
+    return numpy.where(degreesOfFreedom <= 30, T_DISTRIBUTION_95[numpy.minimum(degreesOfFreedom, 30).astype(numpy.int64)], tail)
 
 class ATLASTestContainer:
     def __init__(self, processID):
@@ -41,6 +60,12 @@ class ATLASTestContainer:
 
         # Do not change
         self.working_on_id = 10
+
+        # Local mirror of the test spec sheet, created on the first sheets read
+        self.specCache = None
+
+        # Journaled claim queue for the local csv spec, created on the first csv read
+        self.testQueue = None
         
         # Header to be reused in the results
         self.fileHeader = "AV Probability, CAV Probability, Scale, Step Count, Total Vehicles, Total AVs, Total CAVs," + "totalVehicles,totalTimeLoss,averageTimeLoss,averagewaitingTime,waitingTimeSTDDev,totalWaitingTime,averageSpeed,noramlizedDurationSTDDev,noramlizedDurationMean,minTimeLoss,maxTimeLoss,average co2,average co,average hc,average nox,average pmx,fuel usage,electicity usage" + '\n'
@@ -59,46 +84,20 @@ class ATLASTestContainer:
         return True
 
     def readNextInputParallel(self, filename):
-        lock_path = filename + ".lock"
-        lock = FileLock(lock_path)
-        with lock:
-            # work with the file as it is now locked
-            print("Lock acquired.")
-            # Read the csv file containing all of our test data
-            with open(filename, 'r') as file:
-                reader = csv.reader(file)
-                inputList = list(reader)
-                
-                if self.testInputFile(inputList) == False:
-                    self.validTest = False
-                    return False
-                
-                self.testIdx = -1
-                # This row contains the iterations left to complete
-                for idx, iterationsLeft in enumerate(inputList[0][1:]):
-                    if int(iterationsLeft) > 0:
-                        # Offset for the fact we started at idx = 1
-                        self.testIdx = idx + 1
-                        break
-                
-                # Remove the iteration from the counter
-                inputList[0][self.testIdx] = int(inputList[0][self.testIdx]) - 1
-                
-                # Add our instance to the working flags
-                inputList[self.expectedLength-1][self.testIdx] = int(inputList[self.expectedLength-1][self.testIdx]) + 1
-                
-                # Remove our old working flag if there is one
-                if self.workingOn != -1:
-                    # Here we are removing our working on flag from the list
-                    inputList[self.expectedLength-1][self.workingOn] = int(inputList[self.expectedLength-1][self.workingOn]) - 1
-                
-                print ( inputList )
-                
-            with open(filename, 'w', newline='') as file:
-                # Write back the csv lines with the modified durations remaining
-                writer = csv.writer(file)
-                writer.writerows(inputList)
-            
+        # Claims are appended to a journal next to the csv, the csv itself is only read
+        if self.testQueue == None or self.testQueue.filename != filename:
+            self.testQueue = csv_queue_journal.CSVQueueJournal(filename, self.expectedLength)
+
+        # Read the csv file containing all of our test data
+        inputList = self.testQueue.readSpec()
+
+        if self.testInputFile(inputList) == False:
+            self.validTest = False
+            return False
+
+        self.testIdx = self.testQueue.claim(self.processID, self.workingOn)
+        print ( "Claimed test ", self.testIdx, " remaining ", self.testQueue.remaining, " working ", self.testQueue.working )
+
         # Get the test values
         if self.testIdx != -1:
             # Names
@@ -186,6 +185,38 @@ class ATLASTestContainer:
                 else:
                     print ( "unknown GSUITE error...17", str(e) )
             
+    def trygetallvalues(self, worksheet):
+        # We need to make sure that this is added even if we exceed the requests per minute quota of google API
+        while True:
+            try:
+                return worksheet.get_all_values()
+            except Exception as e:
+                if str(e).find("RESOURCE_EXHAUSTED")>-1:
+                    print ("resource exhausted...20")
+                    time.sleep(10)
+                else:
+                    print ( "unknown GSUITE error...21", str(e) )
+
+    def trybatchread(self, worksheet, cells):
+        # Read several single cells in one request, cells are (row, col) pairs
+        while True:
+            try:
+                ranges = worksheet.batch_get([rowcol_to_a1(row, col) for row, col in cells])
+                break
+            except Exception as e:
+                if str(e).find("RESOURCE_EXHAUSTED")>-1:
+                    print ("resource exhausted...22")
+                    time.sleep(10)
+                else:
+                    print ( "unknown GSUITE error...23", str(e) )
+        values = []
+        for valueRange in ranges:
+            if len(valueRange) > 0 and len(valueRange[0]) > 0:
+                values.append(valueRange[0][0])
+            else:
+                values.append('')
+        return values
+
     def readNextInputParallelGoogleSheets(self, filename):
         # use creds to create a client to interact with the Google Drive API
         scope = ['https://spreadsheets.google.com/feeds',
@@ -204,90 +235,72 @@ class ATLASTestContainer:
         #worksheet = sheet.get_worksheet(0)
         worksheet = self.trygetworksheet(sheet, 0)
 
-        #if self.testInputFile(worksheet) == False:
-        #    self.validTest = False
-        #    return False
-        
-        # trycount = 0
-        # while True:
-            # print ( " Trying " , trycount )
-            # trycount = trycount + 1
+        if self.specCache == None or self.specCache.sheetKey != filename:
+            self.specCache = spec_cache.SpecSheetCache(filename)
 
         self.testIdx = -1
-        idx = 2
         val = -1
-        
-        # This row contains the iterations left to complete
-        while True:
-            try:
-                row_values_list = [0] + worksheet.row_values(2)
-                break
-            except Exception as e:
-                if str(e).find("RESOURCE_EXHAUSTED")>-1:
-                    print ("resource exhausted...18")
-                    time.sleep(10)
-                else:
-                    print ( "unknown GSUITE error...19" , str(e) )
-                    
+
+        # Pick the test from our local copy of the spec sheet and only check the live counter
+        # (plus the working flags we are about to change) in one batched read. If the copy
+        # turns out to be wrong we refresh it and try again.
+        refreshed = self.specCache.sync(worksheet, self)
         while True:
-            if idx >= len(row_values_list):
-                self.testIdx == -99
-                break
-            # Get all value with coords
-            # Use try catch here in case we hit the end of the sheet!
+            candidateIdx = self.specCache.nextTestIdx()
+            if candidateIdx == -1:
+                if refreshed:
+                    break
+                # Nothing left in our copy, make sure that is really the case before giving up
+                refreshed = self.specCache.sync(worksheet, self, force=True)
+                continue
+
+            cells = [(2, candidateIdx), (self.working_on_id, candidateIdx)]
+            if self.workingOn != -1:
+                cells.append((self.working_on_id, self.workingOn))
+            liveValues = self.trybatchread(worksheet, cells)
+
             try:
-                val = int(row_values_list[idx])
+                val = int(liveValues[0])
             except:
-                break
+                val = 0
 
-            #val = int(worksheet.cell(2, idx).value)
             if val > 0:
-                # save this index
-                self.testIdx = idx
-                break
-            elif val <= 0:
-                idx = idx + 1
-            else:
+                self.testIdx = candidateIdx
+                if str(val) != self.specCache.cell(2, candidateIdx):
+                    # Still claimable, but our copy is behind so get a new one next time
+                    self.specCache.invalidate()
                 break
 
+            # Claim conflict, somebody else finished this column before us
+            print ( "Spec cache conflict on column ", candidateIdx, " refreshing" )
+            refreshed = self.specCache.sync(worksheet, self, force=True)
+
         if self.testIdx == -1:
             self.validTest = False
             self.workingOn = -1
             return False
-            
+
         # Remove our old working flag if there is one
         if self.workingOn != -1:
             self.proccessed = self.proccessed + 1
             # Here we are removing our working on flag from the list
-            self.tryupdate(worksheet, self.working_on_id, self.workingOn, int(self.tryread(worksheet, self.working_on_id, self.workingOn)) - 1)
-            #worksheet.update_cell(20, self.workingOn, int(worksheet.cell(20, self.workingOn).value) - 1)
-        
-        # Test succeess
-        if self.testIdx == -99:
-            self.validTest = False
-            #self.workingOn = -1
-            return False
+            oldFlag = int(liveValues[2]) - 1
+            self.tryupdate(worksheet, self.working_on_id, self.workingOn, oldFlag)
+            self.specCache.setCell(self.working_on_id, self.workingOn, oldFlag, save=False)
 
         # Remove the iteration from the counter
         self.tryupdate(worksheet, 2, self.testIdx, val - 1)
-        #worksheet.update_cell(2, self.testIdx, val - 1)
-        
-        # Get the test values
-        while True:
-            try:
-                col_values_list = worksheet.col_values(self.testIdx)
-                break
-            except Exception as e:
-                if str(e).find("RESOURCE_EXHAUSTED")>-1:
-                    print ("resource exhausted...1")
-                    time.sleep(10)
-                else:
-                    print ( "unknown GSUITE error...2" , str(e) )
+        self.specCache.setCell(2, self.testIdx, val - 1, save=False)
 
         # Add our instance to the working flags
-        flag = int(self.tryread(worksheet, self.working_on_id, self.testIdx)) + 1
+        flag = int(liveValues[1]) + 1
         self.tryupdate(worksheet, self.working_on_id, self.testIdx, flag)
-        #worksheet.update_cell(20, self.testIdx, int(worksheet.cell(20, self.testIdx).value) + 1)
+        self.specCache.setCell(self.working_on_id, self.testIdx, flag, save=False)
+        # One write of the local copy for the whole claim
+        self.specCache.save()
+
+        # Get the test values
+        col_values_list = self.specCache.column(self.testIdx)
 
         # Names
         print(col_values_list)
@@ -311,6 +324,7 @@ class ATLASTestContainer:
         headerArray.append("avProbability")
         headerArray.append("cavProbability")
         headerArray.append("scale")
+        headerArray.append("timestep")
         headerArray.append("trafficSet")
 
         return headerArray
@@ -338,13 +352,28 @@ class ATLASTestContainer:
 
         return headerArray
         
+    def returnVehicleClassDataHeader(self):
+        headerArray = []
+        for vehicleClass in xml_parser.VEHICLE_CLASSES:
+            for name in self.returnXMLDataHeader():
+                headerArray.append(vehicleClass + "_" + name)
+        return headerArray
+
+    def returnPercentileDataHeader(self):
+        return list(xml_parser.PERCENTILE_FIELDS)
+
     def returnStatsDataHeader(self):
+        # Same order returnOutputRow writes the traci stats in
         headerArray = []
-        headerArray.append("step")
         headerArray.append("totalVehicles")
         headerArray.append("totalAVs")
         headerArray.append("totalCAVs")
+        headerArray.append("step")
         return headerArray
+
+    def returnResultDataHeader(self):
+        # Names of the result columns of returnOutputRow, i.e. everything after the test settings
+        return self.returnOutputRowHeader()[7:]
         
     def writeOutputFile(self, traciStats, xmlStats, overallFileName):
         lock_path = overallFileName + ".lock"
@@ -363,24 +392,8 @@ class ATLASTestContainer:
 
             file.close()
             
-    def writeOutputFileGoogleSheets(self, traciStats, overallFileName, SUMOStats = None, collisionStats = None):
-        # use creds to create a client to interact with the Google Drive API
-        scope = ['https://spreadsheets.google.com/feeds',
-                 'https://www.googleapis.com/auth/drive']
-
-        credentials = ServiceAccountCredentials.from_json_keyfile_name('../credentials/sheets_credentials.json', scope)
-
-        gc = self.trygetauthorization(gspread, credentials)
-
-        # If you want to be specific, use a key (which can be extracted from
-        # the spreadsheet's url)
-        #sheet = gc.open_by_key(overallFileName)
-        sheet = self.trygetfile(gc, overallFileName)
-
-        # Select worksheet by index. Worksheet indexes start from zero
-        #worksheet = sheet.get_worksheet(0)
-        worksheet = self.trygetworksheet(sheet, 0)
-
+    def returnOutputRow(self, traciStats, SUMOStats = None, collisionStats = None):
+        # One result row, test settings first (columns 0-6) then the results
         output = []
         output.append(self.mapname)
         output.append(str(self.avProbability))
@@ -390,8 +403,6 @@ class ATLASTestContainer:
         output.append(str(self.trafficSet))
         output.append(str(self.logEmisisonsData))
 
-        print ( output )
-
         output.append(str(traciStats["totalVehicles"]))
         output.append(str(traciStats["totalAVs"]))
         output.append(str(traciStats["totalCAVs"]))
@@ -422,6 +433,46 @@ class ATLASTestContainer:
         if collisionStats != None:
             output.append(collisionStats)
 
+        if SUMOStats != None:
+            # Per vehicle class breakdown, see returnVehicleClassDataHeader
+            for vehicleClass in xml_parser.VEHICLE_CLASSES:
+                classStats = SUMOStats.vehicleClasses.get(vehicleClass, xml_parser.SUMOXMLDataParser())
+                for name in xml_parser.RESULT_FIELDS:
+                    output.append(getattr(classStats, name))
+
+            # Percentiles go last so the columns before them keep their place
+            for name in xml_parser.PERCENTILE_FIELDS:
+                output.append(getattr(SUMOStats, name))
+
+        return output
+
+    def returnOutputRowHeader(self):
+        # Names for the columns of returnOutputRow
+        headerArray = ["mapname", "avProbability", "cavProbability", "scale", "timestep", "trafficSet", "logEmisisonsData"]
+        headerArray = headerArray + ["traciTotalVehicles", "traciTotalAVs", "traciTotalCAVs", "traciStep"]
+        headerArray = headerArray + self.returnXMLDataHeader() + ["collisions"] + self.returnVehicleClassDataHeader() + self.returnPercentileDataHeader()
+        return headerArray
+
+    def writeOutputFileGoogleSheets(self, traciStats, overallFileName, SUMOStats = None, collisionStats = None):
+        # use creds to create a client to interact with the Google Drive API
+        scope = ['https://spreadsheets.google.com/feeds',
+                 'https://www.googleapis.com/auth/drive']
+
+        credentials = ServiceAccountCredentials.from_json_keyfile_name('../credentials/sheets_credentials.json', scope)
+
+        gc = self.trygetauthorization(gspread, credentials)
+
+        # If you want to be specific, use a key (which can be extracted from
+        # the spreadsheet's url)
+        #sheet = gc.open_by_key(overallFileName)
+        sheet = self.trygetfile(gc, overallFileName)
+
+        # Select worksheet by index. Worksheet indexes start from zero
+        #worksheet = sheet.get_worksheet(0)
+        worksheet = self.trygetworksheet(sheet, 0)
+
+        output = self.returnOutputRow(traciStats, SUMOStats, collisionStats)
+
         # We need to make sure that this is added even if we exceed the requests per minute quota of google API
         while True:
             try:
@@ -435,6 +486,27 @@ class ATLASTestContainer:
                     print ( "unknown GSUITE error...4" , str(e)  )
                     time.sleep(10)
         
+    def writeOutputFileRunningStats(self, traciStats, overallFileName, SUMOStats = None, collisionStats = None):
+        # Fold this run into the running statistics of its configuration so summaries never need a rescan
+        aggregator = result_aggregator.ResultAggregator("../output/" + overallFileName + "_running_stats.json")
+        # The sketches are merged as well so the summary also has percentiles over every vehicle of every run
+        sketches = SUMOStats.sketches if SUMOStats != None else None
+        aggregator.update(self.returnOutputRow(traciStats, SUMOStats, collisionStats), sketches)
+        self.writeRunningStatsSummary(overallFileName)
+
+    def writeRunningStatsSummary(self, overallFileName):
+        aggregator = result_aggregator.ResultAggregator("../output/" + overallFileName + "_running_stats.json")
+        dataHeader = self.returnResultDataHeader()
+        header = self.printHeaders() + ["numberOfRuns"] + dataHeader + [name + "STDDev" for name in dataHeader] + [name + "Min" for name in dataHeader] + [name + "Max" for name in dataHeader]
+        header = header + ["pooled_" + name for name in self.returnPercentileDataHeader()]
+        # Runs without emissions or collisions have shorter rows, every block is padded to the header
+        aggregator.writeSummaryFile("../output/" + overallFileName + "_running_stats.csv", header, len(dataHeader))
+
+    def writeOutputFileColumnar(self, traciStats, overallFileName, SUMOStats = None, collisionStats = None):
+        # Typed column files for analysis, see columnar_store.ColumnarResultStore.load
+        store = columnar_store.ColumnarResultStore("../output/" + overallFileName + "_columns")
+        store.append(dict(zip(self.returnOutputRowHeader(), self.returnOutputRow(traciStats, SUMOStats, collisionStats))))
+
     def writeThreadStartSheets(self, fileName, timestamp):
         # use creds to create a client to interact with the Google Drive API
         scope = ['https://spreadsheets.google.com/feeds',
@@ -547,9 +619,6 @@ class ATLASTestContainer:
     def parseOutputFile(self, outputFileName):
         parsedOutputFileName = outputFileName.replace(".csv", "_parsed.csv")
         
-        parsedResults = []
-        parsedSubsetResults = []
-        
         # Read the values within the outputFileName
         lock_path = outputFileName + ".lock"
         lock = FileLock(lock_path)
@@ -561,49 +630,83 @@ class ATLASTestContainer:
                 reader = csv.reader(file)
                 inputList = list(reader)
             
-            # Pop the first element because it is just labels
-            inputList.pop(0)
+        # Pop the first element because it is just labels
+        inputList.pop(0)
+
+        # Hash each configuration to a group number, columns 0-5 describe the configuration
+        groupIndex = {}
+        groupIds = numpy.empty(len(inputList), dtype=numpy.int64)
+        width = 0
+        for idx, row in enumerate(inputList):
+            groupIds[idx] = groupIndex.setdefault(tuple(row[0:6]), len(groupIndex))
+            width = max(width, len(row) - 7)
+
+        # Results start at column 7, anything missing or unreadable becomes NaN and is left out of the stats
+        padded = [row[7:] + ['nan'] * (width - len(row) + 7) for row in inputList]
+        values = numpy.empty((len(inputList), width))
+        for columnIdx, column in enumerate(zip(*padded)):
+            try:
+                values[:, columnIdx] = list(map(float, column))
+            except ValueError:
+                # Only columns holding errors (e.g. "xml data error") take the slow path
+                for idx, cell in enumerate(column):
+                    try:
+                        values[idx, columnIdx] = float(cell)
+                    except ValueError:
+                        values[idx, columnIdx] = numpy.nan
+
+        averagedResults, stdDevResults, confidenceResults, runCounts = self.aggregateGroups(values, groupIds, len(groupIndex))
+
+        dataHeader = self.returnResultDataHeader()
+        dataHeader = dataHeader + ["column" + str(idx) for idx in range(len(dataHeader), width)]
+        dataHeader = dataHeader[0:width]
+
+        with open(parsedOutputFileName, 'w', newline='') as file:
+            # Write back the csv lines with the modified durations remaining
+            writer = csv.writer(file)
             
-            # We should sort the output first so this looks orderly
-            s = sorted(inputList, key = operator.itemgetter(0, 1, 2, 3, 4, 5, 6))
-
-            for idx, row in enumerate(s):
-                print ( len(row), row )
-                found = False
-                for parsedIdx, dataset in enumerate(parsedResults):
-                    if row[0:6] == dataset:
-                        found = True
-                        parsedSubsetResults[parsedIdx].append(row[7:])
-                        break
-                if found == False:
-                    parsedResults.append(row[0:6])
-                    parsedSubsetResults.append([row[7:]])
-        
-            #print ( parsedResults )
+            writer.writerow(self.printHeaders() + dataHeader + ["numberOfRuns"] + [name + "STDDev" for name in dataHeader] + [name + "CI95" for name in dataHeader])
             
-            averagedResults = []
-            stdDevResults = []
-            for entry in parsedSubsetResults:
-                tempAverages = []
-                tempStdDeviations = []
-                if len(entry) > 0:
-                    for columnIdx in range(len(entry[0])):
-                        column = [float(row[columnIdx]) for row in entry]
-                        tempStdDeviations.append(len(column))
-                        if len(column) > 1:
-                            tempAverages.append(statistics.mean(column))
-                            tempStdDeviations.append(statistics.stdev(column))
-                        else:
-                            tempAverages.append(column[0])
-                            tempStdDeviations.append(column[0])
-                averagedResults.append(tempAverages)
-                stdDevResults.append(tempStdDeviations)
-
-            with open(parsedOutputFileName, 'w', newline='') as file:
-                # Write back the csv lines with the modified durations remaining
-                writer = csv.writer(file)
-                
-                writer.writerow(self.printHeaders() + self.returnStatsDataHeader() + self.returnXMLDataHeader() + ["numberOfRuns"] + self.returnStatsDataHeader() + self.returnXMLDataHeader())
-                
-                for idx, row in enumerate(parsedResults):
-                     writer.writerow(row[0:6] + averagedResults[idx] + stdDevResults[idx])
+            # Sorted by configuration so this looks orderly
+            for key in sorted(groupIndex):
+                group = groupIndex[key]
+                writer.writerow(list(key) + averagedResults[group].tolist() + [runCounts[group]] + stdDevResults[group].tolist() + confidenceResults[group].tolist())
+
+    def aggregateGroups(self, values, groupIds, groupCount):
+        # Per group and per column mean, sample std dev and 95% confidence half width, all vectorized
+        width = values.shape[1]
+        if groupCount == 0:
+            empty = numpy.zeros((0, width))
+            return empty, empty, empty, numpy.zeros(0, dtype=numpy.int64)
+
+        # Put the rows of every group next to each other so each group is one contiguous slice
+        order = numpy.argsort(groupIds, kind='stable')
+        sortedIds = groupIds[order]
+        sortedValues = values[order]
+        starts = numpy.flatnonzero(numpy.r_[True, sortedIds[1:] != sortedIds[:-1]])
+
+        valid = ~numpy.isnan(sortedValues)
+        filled = numpy.where(valid, sortedValues, 0.0)
+        counts = numpy.add.reduceat(valid.astype(numpy.float64), starts, axis=0)
+        runCounts = numpy.diff(numpy.r_[starts, len(sortedIds)])
+
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            means = numpy.add.reduceat(filled, starts, axis=0) / counts
+            # Two pass variance so large values do not cancel out
+            deviations = numpy.where(valid, sortedValues - means[numpy.repeat(numpy.arange(len(starts)), runCounts)], 0.0)
+            variance = numpy.add.reduceat(deviations * deviations, starts, axis=0) / (counts - 1)
+            stdDevs = numpy.where(counts > 1, numpy.sqrt(variance), 0.0)
+            tValues = returnTValues95(counts - 1)
+            confidence = numpy.where(counts > 1, tValues * stdDevs / numpy.sqrt(counts), 0.0)
+
+        # Results come back in group number order
+        groupOrder = sortedIds[starts]
+        averagedResults = numpy.empty_like(means)
+        stdDevResults = numpy.empty_like(stdDevs)
+        confidenceResults = numpy.empty_like(confidence)
+        groupRunCounts = numpy.empty_like(runCounts)
+        averagedResults[groupOrder] = means
+        stdDevResults[groupOrder] = stdDevs
+        confidenceResults[groupOrder] = confidence
+        groupRunCounts[groupOrder] = runCounts
+        return averagedResults, stdDevResults, confidenceResults, groupRunCounts
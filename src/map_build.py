@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# Build the SUMO network (netconvert) and polygons (polyconvert) of the bundled maps on any platform
+# and route their trips (see route_cache.py), so a fresh node is ready to run tests in one step.
+# Each step runs from the map's own osm.netccfg / osm.polycfg with the OSM typemaps of the local
+# SUMO installation and is skipped when the hashes of its inputs, its config and the tool version
+# match the ones recorded in the map's build_manifest.json.
+# Both outputs (osm.net.xml, osm.poly.xml) are build products and ignored by git.
+#
+# python map_build.py --maps tempe_2x3,arizona_highway_i_10
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+from filelock import FileLock
+import hashlib
+import json
+import optparse
+import os
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    sys.path.append(os.path.join(os.environ['SUMO_HOME'], 'tools'))
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+from sumolib import checkBinary  # noqa
+import route_cache  # noqa
+
+# Tool, its config in the map folder and the typemap option whose value in the configs is a Windows install path
+BUILD_STEPS = [("netconvert", "osm.netccfg", "--type-files", "osmNetconvert.typ.xml"),
+               ("polyconvert", "osm.polycfg", "--type-file", "osmPolyconvert.typ.xml")]
+
+MANIFEST_NAME = "build_manifest.json"
+
+
+def readConfig(configFileName):
+    # Input files and the output file named by a netconvert/polyconvert config, relative to the config's folder
+    configDirectory = os.path.dirname(configFileName)
+    root = ET.parse(configFileName).getroot()
+    inputFileNames = []
+    for option in root.find('input'):
+        if option.tag in ['type-files', 'type-file']:
+            continue
+        for value in option.get('value', "").split(","):
+            fileName = os.path.join(configDirectory, value.strip())
+            if value.strip() != "" and os.path.isfile(fileName):
+                inputFileNames.append(fileName)
+    outputFileName = os.path.join(configDirectory, root.find('output').find('output-file').get('value'))
+    return inputFileNames, outputFileName
+
+
+def toolVersion(binary):
+    process = subprocess.run([binary, "--version"], stdout=subprocess.PIPE, universal_newlines=True)
+    return process.stdout.splitlines()[0] if process.stdout else ""
+
+
+def returnStepKey(configFileName, inputFileNames, typeMapFileName, binary):
+    sha = hashlib.sha1()
+    for fileName in [configFileName] + inputFileNames + [typeMapFileName]:
+        sha.update(os.path.basename(fileName).encode())
+        sha.update(route_cache.hashFile(fileName).encode())
+    sha.update(toolVersion(binary).encode())
+    return sha.hexdigest()
+
+
+def readManifest(mapDirectory):
+    manifestFileName = os.path.join(mapDirectory, MANIFEST_NAME)
+    if not os.path.exists(manifestFileName):
+        return {}
+    with open(manifestFileName, 'r') as file:
+        return json.load(file)
+
+
+def writeManifest(mapDirectory, manifest):
+    manifestFileName = os.path.join(mapDirectory, MANIFEST_NAME)
+    tempFileName = manifestFileName + ".tmp"
+    with open(tempFileName, 'w') as file:
+        json.dump(manifest, file, indent=1)
+    os.replace(tempFileName, manifestFileName)
+
+
+def buildStep(mapDirectory, manifest, tool, configName, typeMapOption, typeMapName, force=False):
+    # Returns True when the step had to run
+    configFileName = os.path.join(mapDirectory, configName)
+    inputFileNames, outputFileName = readConfig(configFileName)
+    typeMapFileName = os.path.join(os.environ['SUMO_HOME'], "data", "typemap", typeMapName)
+    binary = checkBinary(tool)
+    key = returnStepKey(configFileName, inputFileNames, typeMapFileName, binary)
+
+    recorded = manifest.get(tool)
+    if not force and recorded != None and recorded["key"] == key and os.path.exists(outputFileName) \
+            and route_cache.hashFile(outputFileName) == recorded["output"]:
+        print ( " ", tool, " up to date: ", outputFileName )
+        return False
+
+    print ( " running ", tool, " for ", outputFileName )
+    # Write next to the real output and swap it in, a failed build never leaves half a network behind
+    tempFileName = outputFileName + ".building"
+    subprocess.run([binary, "-c", configFileName, typeMapOption, typeMapFileName, "--output-file", tempFileName], check=True)
+    os.replace(tempFileName, outputFileName)
+    manifest[tool] = {"key": key, "output": route_cache.hashFile(outputFileName)}
+    writeManifest(mapDirectory, manifest)
+    return True
+
+
+def buildMap(mapDirectory, force=False, routes=True):
+    # Nodes sharing a checkout must not build the same map at the same time
+    with FileLock(os.path.normpath(mapDirectory) + ".build.lock"):
+        manifest = readManifest(mapDirectory)
+        for tool, configName, typeMapOption, typeMapName in BUILD_STEPS:
+            # The polygon step hashes the network as one of its inputs, a new network rebuilds it too
+            buildStep(mapDirectory, manifest, tool, configName, typeMapOption, typeMapName, force)
+    if routes:
+        print ( "  routes: ", route_cache.RouteCache(os.path.join(mapDirectory, "osm.sumocfg")).returnRouteFile() )
+
+
+def get_options():
+    optParser = optparse.OptionParser()
+    optParser.add_option("--maps", type="string", dest="maps", default="tempe_2x3,arizona_highway_i_10", help="Comma separated map folders under ../maps/")
+    optParser.add_option("--force", action="store_true", default=False, help="Rebuild even when nothing changed")
+    optParser.add_option("--no_routes", action="store_true", default=False, help="Do not prepare the route cache")
+    options, args = optParser.parse_args()
+    return options
+
+
+# this is the main entry point of this script
+if __name__ == "__main__":
+    options = get_options()
+    for mapName in options.maps.split(","):
+        print ( "Building ", mapName )
+        buildMap(os.path.join("../maps", mapName), options.force, not options.no_routes)
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# Benchmark xml_parser on synthetic tripinfo and collision output.
+# Every case is parsed in its own process so peak memory is measured per case, the parsed
+# statistics are checked against values computed while the file was generated and all numbers
+# end up in a JSON file that later runs can be compared against (--compare).
+#
+# python parser_benchmark.py --sizes 1000,10000,100000,1000000 --output ../output/parser_benchmark.json
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import gzip
+import json
+import optparse
+import os
+import subprocess
+import sys
+import time
+import numpy
+import xml_parser
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak memory is reported as None there
+    resource = None
+
+# Share of each vType in the synthetic fleet, same types the runner assigns
+VEHICLE_TYPE_SHARES = [("veh_passenger", 0.7), ("AV_passenger", 0.1), ("AV_passenger_conservative", 0.1), ("CAV_passenger", 0.1)]
+
+# One collision for this many vehicles
+VEHICLES_PER_COLLISION = 40
+
+# Parsed values have to match the generated ones this closely, the percentiles come from a sketch
+RELATIVE_TOLERANCE = 1e-9
+PERCENTILE_TOLERANCE = 0.01
+
+
+def peakMemory():
+    # Peak resident set size of this process in bytes. ru_maxrss on Linux carries over the parent's
+    # peak through fork, the high water mark in /proc belongs to this process alone
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status", 'r') as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    if resource == None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+
+def openForWriting(fileName):
+    if fileName.endswith(".gz"):
+        return gzip.open(fileName, 'wt')
+    return open(fileName, 'w')
+
+
+def formatHundredths(values):
+    # Values are kept as integer hundredths so the text in the file and the expected values agree exactly
+    return ["%d.%02d" % (value // 100, value % 100) for value in values.tolist()]
+
+
+def expectedTripStatistics(columns, mask=None):
+    # Same definitions as xml_parser.TripStatistics, computed on the whole arrays at once
+    if mask is not None:
+        columns = {name: values[mask] for name, values in columns.items()}
+    result = xml_parser.SUMOXMLDataParser()
+    result.totalVehicles = len(columns['timeLoss'])
+    if result.totalVehicles == 0:
+        return result
+
+    timeLoss = columns['timeLoss']
+    duration = columns['duration']
+    noramlizedDuration = duration / (duration - timeLoss)
+    result.totalTimeLoss = float(numpy.sum(timeLoss))
+    result.averageTimeLoss = result.totalTimeLoss / result.totalVehicles
+    result.totalWaitingTime = float(numpy.sum(columns['waitingTime']))
+    result.averageWaitingTime = result.totalWaitingTime / result.totalVehicles
+    result.waitingTimeSTDDev = float(numpy.std(timeLoss))
+    result.averageSpeed = float(numpy.sum(columns['routeLength'] / duration)) / result.totalVehicles
+    result.noramlizedDurationSTDDev = float(numpy.std(noramlizedDuration))
+    result.noramlizedDurationMean = float(numpy.mean(noramlizedDuration))
+    result.minTimeLoss = float(numpy.min(noramlizedDuration))
+    result.maxTimeLoss = float(numpy.max(noramlizedDuration))
+    for field, name in [("averageco2", 'CO2_abs'), ("averageco", 'CO_abs'), ("averagehc", 'HC_abs'), ("averagenox", 'NOx_abs'),
+                        ("averagepmx", 'PMx_abs'), ("averagefuel", 'fuel_abs'), ("averageelectricity", 'electricity_abs')]:
+        if name in columns:
+            setattr(result, field, float(numpy.mean(columns[name])))
+
+    distributions = {'timeLoss': timeLoss, 'waitingTime': columns['waitingTime'], 'noramlizedDuration': noramlizedDuration}
+    for name in xml_parser.SKETCH_ATTRIBUTES:
+        for percentile in xml_parser.PERCENTILES:
+            # The sketch ranks like numpy's 'lower' method, done by hand since the keyword for it differs between numpy versions
+            ordered = numpy.sort(distributions[name])
+            setattr(result, name + "P" + str(percentile), float(ordered[int((len(ordered) - 1) * percentile // 100)]))
+    return result
+
+
+def returnResultDict(result):
+    data = {}
+    for name in xml_parser.RESULT_FIELDS + xml_parser.PERCENTILE_FIELDS:
+        data[name] = getattr(result, name)
+    data["vehicleClasses"] = {}
+    for vehicleClass, classResult in result.vehicleClasses.items():
+        data["vehicleClasses"][vehicleClass] = {name: getattr(classResult, name) for name in xml_parser.RESULT_FIELDS}
+    return data
+
+
+def generateTripInfo(fileName, vehicles, emissions, seed):
+    # Written a chunk of vehicles at a time, returns the statistics the parser should come up with
+    generator = numpy.random.default_rng(seed)
+    duration = generator.integers(6000, 120000, vehicles)
+    # Strictly below the duration so the normalized duration stays finite
+    timeLoss = (duration * generator.uniform(0.0, 0.9, vehicles)).astype(numpy.int64)
+    waitingTime = (timeLoss * generator.uniform(0.0, 0.8, vehicles)).astype(numpy.int64)
+    routeLength = generator.integers(10000, 1000000, vehicles)
+    shares = numpy.array([share for vType, share in VEHICLE_TYPE_SHARES])
+    vTypeCodes = generator.choice(len(VEHICLE_TYPE_SHARES), size=vehicles, p=shares / shares.sum())
+    columns = {'timeLoss': timeLoss, 'waitingTime': waitingTime, 'routeLength': routeLength, 'duration': duration}
+    if emissions:
+        for name in xml_parser.EMISSION_ATTRIBUTES:
+            columns[name] = generator.integers(0, 5000000, vehicles)
+
+    with openForWriting(fileName) as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        file.write('<tripinfos xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n')
+        chunkSize = 10000
+        for start in range(0, vehicles, chunkSize):
+            end = min(start + chunkSize, vehicles)
+            text = {name: formatHundredths(values[start:end]) for name, values in columns.items()}
+            lines = []
+            for idx in range(end - start):
+                vType = VEHICLE_TYPE_SHARES[vTypeCodes[start + idx]][0]
+                lines.append('    <tripinfo id="veh%d" depart="%d.00" departLane="lane_0" arrival="0.00" duration="%s" routeLength="%s" '
+                             'waitingTime="%s" waitingCount="1" stopTime="0.00" timeLoss="%s" rerouteNo="0" vType="%s" speedFactor="1.00"'
+                             % (start + idx, start + idx, text['duration'][idx], text['routeLength'][idx], text['waitingTime'][idx], text['timeLoss'][idx], vType))
+                if emissions:
+                    lines.append('>\n        <emissions ' + " ".join(['%s="%s"' % (name, text[name][idx]) for name in xml_parser.EMISSION_ATTRIBUTES]) + '/>\n    </tripinfo>\n')
+                else:
+                    lines.append('/>\n')
+            file.write("".join(lines))
+        file.write('</tripinfos>\n')
+
+    columns = {name: values / 100.0 for name, values in columns.items()}
+    expected = expectedTripStatistics(columns)
+    vehicleClasses = numpy.array([xml_parser.returnVehicleClass(vType) for vType, share in VEHICLE_TYPE_SHARES])[vTypeCodes]
+    for vehicleClass in xml_parser.VEHICLE_CLASSES:
+        expected.vehicleClasses[vehicleClass] = expectedTripStatistics(columns, vehicleClasses == vehicleClass)
+    return returnResultDict(expected)
+
+
+def generateCollisions(fileName, collisions, seed):
+    generator = numpy.random.default_rng(seed)
+    times = generator.integers(0, 420000, collisions)
+    lanes = ["edge%d_%d" % (edge, lane) for edge, lane in zip(generator.integers(0, 200, collisions).tolist(), generator.integers(0, 3, collisions).tolist())]
+    types = generator.choice(["collision", "frontal", "junction"], size=collisions, p=[0.8, 0.1, 0.1]).tolist()
+
+    expected = {"totalCollisions": collisions, "byType": {}, "byLane": {}, "byTimeBucket": {}}
+    with openForWriting(fileName) as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n<collisions>\n')
+        for idx, collisionTime in enumerate(formatHundredths(times)):
+            file.write('    <collision time="%s" type="%s" lane="%s" pos="10.00" collider="veh%d" victim="veh%d" colliderType="veh_passenger" '
+                       'victimType="veh_passenger" colliderSpeed="10.00" victimSpeed="5.00"/>\n' % (collisionTime, types[idx], lanes[idx], 2 * idx, 2 * idx + 1))
+            expected["byType"][types[idx]] = expected["byType"].get(types[idx], 0) + 1
+            expected["byLane"][lanes[idx]] = expected["byLane"].get(lanes[idx], 0) + 1
+            bucket = str(int(times[idx] // 100 // 300) * 300)
+            expected["byTimeBucket"][bucket] = expected["byTimeBucket"].get(bucket, 0) + 1
+        file.write('</collisions>\n')
+    return expected
+
+
+def prepareFile(directory, kind, size, emissions, compressed, seed):
+    # Generated files are reused as long as their expected values are next to them
+    fileName = os.path.join(directory, "%s_%d_%s_%d.xml" % (kind, size, "emissions" if emissions else "plain", seed))
+    if compressed:
+        fileName = fileName + ".gz"
+    expectedFileName = fileName + ".expected.json"
+    if os.path.exists(fileName) and os.path.exists(expectedFileName):
+        with open(expectedFileName, 'r') as file:
+            return fileName, json.load(file)
+
+    print ( "Generating ", fileName )
+    if kind == "tripinfo":
+        expected = generateTripInfo(fileName, size, emissions, seed)
+    else:
+        expected = generateCollisions(fileName, size, seed)
+    with open(expectedFileName, 'w') as file:
+        json.dump(expected, file)
+    return fileName, expected
+
+
+def parseInWorker(kind, fileName, repeat):
+    # Runs in the child process, only the parse itself is timed and the fastest of repeat parses counts
+    seconds = None
+    for count in range(repeat):
+        startTime = time.perf_counter()
+        if kind == "tripinfo":
+            data = returnResultDict(xml_parser.SUMOOutputParser(fileName).returnParsedDataGoogleSheets())
+        else:
+            data = xml_parser.CollisionOutputParser(fileName).returnParsedDataBreakdown()
+            data["byTimeBucket"] = {str(bucket): count for bucket, count in data["byTimeBucket"].items()}
+        elapsed = time.perf_counter() - startTime
+        if seconds == None or elapsed < seconds:
+            seconds = elapsed
+    return {"seconds": seconds, "peakMemory": peakMemory(), "data": data}
+
+
+def isClose(parsed, expected, tolerance):
+    if isinstance(expected, int) or isinstance(parsed, int):
+        return parsed == expected
+    return abs(parsed - expected) <= tolerance * max(abs(expected), 1e-12)
+
+
+def checkTripInfo(parsed, expected):
+    # Returns the names of the statistics that do not match
+    mismatches = []
+    for name in xml_parser.RESULT_FIELDS:
+        if not isClose(parsed[name], expected[name], RELATIVE_TOLERANCE):
+            mismatches.append(name)
+    for name in xml_parser.PERCENTILE_FIELDS:
+        if not isClose(parsed[name], expected[name], PERCENTILE_TOLERANCE):
+            mismatches.append(name)
+    for vehicleClass in xml_parser.VEHICLE_CLASSES:
+        for name in xml_parser.RESULT_FIELDS:
+            if not isClose(parsed["vehicleClasses"][vehicleClass][name], expected["vehicleClasses"][vehicleClass][name], RELATIVE_TOLERANCE):
+                mismatches.append(vehicleClass + "_" + name)
+    return mismatches
+
+
+def checkCollisions(parsed, expected):
+    return [name for name in ["totalCollisions", "byType", "byLane", "byTimeBucket"] if parsed[name] != expected[name]]
+
+
+def runCase(directory, kind, size, emissions, compressed, seed, repeat):
+    fileName, expected = prepareFile(directory, kind, size, emissions, compressed, seed)
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", kind, "--file", fileName, "--repeat", str(repeat)],
+                             stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    measured = json.loads(process.stdout.strip().splitlines()[-1])
+
+    if kind == "tripinfo":
+        mismatches = checkTripInfo(measured["data"], expected)
+    else:
+        mismatches = checkCollisions(measured["data"], expected)
+    fileSize = os.path.getsize(fileName)
+    return {"kind": kind, "size": size, "emissions": emissions, "compressed": compressed,
+            "fileBytes": fileSize, "seconds": measured["seconds"],
+            "elementsPerSecond": size / measured["seconds"], "megabytesPerSecond": fileSize / 1e6 / measured["seconds"],
+            "peakMemory": measured["peakMemory"], "mismatches": mismatches}
+
+
+def caseKey(case):
+    return "%s_%d_%s_%s" % (case["kind"], case["size"], "emissions" if case["emissions"] else "plain", "gz" if case["compressed"] else "xml")
+
+
+def compareToBaseline(cases, baselineFileName, tolerance):
+    # Flags every case that got slower than the baseline by more than tolerance (0.2 = 20%)
+    with open(baselineFileName, 'r') as file:
+        baseline = {caseKey(case): case for case in json.load(file)["cases"]}
+    slower = []
+    for case in cases:
+        previous = baseline.get(caseKey(case))
+        if previous == None:
+            continue
+        ratio = case["seconds"] / previous["seconds"]
+        print ( " ", caseKey(case), " time vs baseline: ", round(ratio, 3) )
+        if ratio > 1 + tolerance:
+            slower.append(caseKey(case))
+    return slower
+
+
+def get_options():
+    optParser = optparse.OptionParser()
+    optParser.add_option("--sizes", type="string", dest="sizes", default="1000,10000,100000,1000000", help="Comma separated vehicle counts")
+    optParser.add_option("--directory", type="string", dest="directory", default="../output/parser_benchmark/", help="Where the synthetic files are generated")
+    optParser.add_option("--output", type="string", dest="output", default="../output/parser_benchmark.json", help="JSON file the results are written to")
+    optParser.add_option("--compare", type="string", dest="compare", default=None, help="Baseline JSON file from an earlier run to compare against")
+    optParser.add_option("--tolerance", type="float", dest="tolerance", default=0.2, help="Allowed slowdown against the baseline, 0.2 is 20%")
+    optParser.add_option("--compressed", action="store_true", default=False, help="Also benchmark gzip compressed files")
+    optParser.add_option("--repeat", type="int", dest="repeat", default=3, help="Parses per case, the fastest one is reported")
+    optParser.add_option("--seed", type="int", dest="seed", default=42, help="Seed of the synthetic data")
+    # Used internally to parse one file in a fresh process
+    optParser.add_option("--worker", type="string", dest="worker", default=None, help=optparse.SUPPRESS_HELP)
+    optParser.add_option("--file", type="string", dest="file", default=None, help=optparse.SUPPRESS_HELP)
+    options, args = optParser.parse_args()
+    return options
+
+
+# this is the main entry point of this script
+if __name__ == "__main__":
+    options = get_options()
+
+    if options.worker != None:
+        print ( json.dumps(parseInWorker(options.worker, options.file, options.repeat)) )
+        sys.exit(0)
+
+    os.makedirs(options.directory, exist_ok=True)
+    cases = []
+    for size in [int(size) for size in options.sizes.split(",")]:
+        for compressed in ([False, True] if options.compressed else [False]):
+            for emissions in [False, True]:
+                cases.append(runCase(options.directory, "tripinfo", size, emissions, compressed, options.seed, options.repeat))
+                print ( caseKey(cases[-1]), " vehicles/s: ", int(cases[-1]["elementsPerSecond"]), " peak memory: ", cases[-1]["peakMemory"], " mismatches: ", cases[-1]["mismatches"] )
+            cases.append(runCase(options.directory, "crashinfo", max(1, size // VEHICLES_PER_COLLISION), False, compressed, options.seed, options.repeat))
+            print ( caseKey(cases[-1]), " collisions/s: ", int(cases[-1]["elementsPerSecond"]), " peak memory: ", cases[-1]["peakMemory"], " mismatches: ", cases[-1]["mismatches"] )
+
+    results = {"python": sys.version.split()[0], "numpy": numpy.__version__, "platform": sys.platform, "timestamp": time.time(), "cases": cases}
+    tempFileName = options.output + ".tmp"
+    with open(tempFileName, 'w') as file:
+        json.dump(results, file, indent=1)
+    os.replace(tempFileName, options.output)
+    print ( "Results written to ", options.output )
+
+    failed = [caseKey(case) for case in cases if len(case["mismatches"]) > 0]
+    slower = []
+    if options.compare != None:
+        slower = compareToBaseline(cases, options.compare, options.tolerance)
+    if len(failed) > 0:
+        print ( "Statistics do not match for ", failed )
+    if len(slower) > 0:
+        print ( "Slower than the baseline: ", slower )
+    if len(failed) > 0 or len(slower) > 0:
+        sys.exit(1)
@@ -0,0 +1,143 @@
+from filelock import FileLock
+import csv
+import json
+import math
+import os
+import xml_parser
+
+
+class RunningStats:
+    def __init__(self, state=None):
+        # Welford running mean and variance for every result column of one configuration
+        self.runs = 0
+        self.count = []
+        self.mean = []
+        self.m2 = []
+        self.min = []
+        self.max = []
+        if state != None:
+            self.runs = state["runs"]
+            self.count = state["count"]
+            self.mean = state["mean"]
+            self.m2 = state["m2"]
+            self.min = state["min"]
+            self.max = state["max"]
+
+    def update(self, values):
+        self.runs = self.runs + 1
+        while len(self.count) < len(values):
+            self.count.append(0)
+            self.mean.append(0.0)
+            self.m2.append(0.0)
+            self.min.append(None)
+            self.max.append(None)
+
+        for idx, value in enumerate(values):
+            # Anything that is not a number (e.g. "xml data error") is left out of that column
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            if math.isnan(value):
+                continue
+            self.count[idx] = self.count[idx] + 1
+            delta = value - self.mean[idx]
+            self.mean[idx] = self.mean[idx] + delta / self.count[idx]
+            self.m2[idx] = self.m2[idx] + delta * (value - self.mean[idx])
+            if self.min[idx] == None or value < self.min[idx]:
+                self.min[idx] = value
+            if self.max[idx] == None or value > self.max[idx]:
+                self.max[idx] = value
+
+    def stdDev(self):
+        return [math.sqrt(m2 / (count - 1)) if count > 1 else 0.0 for m2, count in zip(self.m2, self.count)]
+
+    def state(self):
+        return {"runs": self.runs, "count": self.count, "mean": self.mean, "m2": self.m2, "min": self.min, "max": self.max}
+
+
+class ResultAggregator:
+    def __init__(self, stateFileName, keyLength=6, valueOffset=7):
+        # Result rows look like returnOutputRow, columns 0-5 are the configuration and results start at column 7
+        self.stateFileName = stateFileName
+        self.keyLength = keyLength
+        self.valueOffset = valueOffset
+        self.lock = FileLock(stateFileName + ".lock")
+
+    def readState(self):
+        if not os.path.exists(self.stateFileName):
+            return {}
+        with open(self.stateFileName, 'r') as file:
+            return json.load(file)
+
+    def writeState(self, state):
+        tempFileName = self.stateFileName + ".tmp"
+        with open(tempFileName, 'w') as file:
+            json.dump(state, file, separators=(',', ':'))
+        os.replace(tempFileName, self.stateFileName)
+
+    def update(self, outputRow, sketches=None):
+        # sketches maps a name in xml_parser.SKETCH_ATTRIBUTES to the QuantileSketch of this run
+        key = ",".join([str(x) for x in outputRow[0:self.keyLength]])
+        with self.lock:
+            state = self.readState()
+            stats = RunningStats(state.get(key))
+            stats.update(outputRow[self.valueOffset:])
+            pooled = self.mergeSketches(state.get(key, {}).get("sketches", {}), sketches)
+            state[key] = stats.state()
+            state[key]["sketches"] = pooled
+            self.writeState(state)
+        return stats
+
+    def mergeSketches(self, pooledState, sketches):
+        if sketches == None:
+            return pooledState
+        pooled = dict(pooledState)
+        for name, sketch in sketches.items():
+            merged = xml_parser.QuantileSketch(state=pooled[name]) if name in pooled else xml_parser.QuantileSketch(sketch.relativeAccuracy)
+            merged.merge(sketch)
+            pooled[name] = merged.state()
+        return pooled
+
+    def returnPooledPercentiles(self, pooledState):
+        # Percentiles over all vehicles of all runs, blank when no run of the configuration had sketches
+        row = []
+        for name in xml_parser.SKETCH_ATTRIBUTES:
+            for percentile in xml_parser.PERCENTILES:
+                if name in pooledState:
+                    row.append(xml_parser.QuantileSketch(state=pooledState[name]).quantile(percentile / 100.0))
+                else:
+                    row.append("")
+        return row
+
+    def returnSummary(self, width=None):
+        # One row per configuration: key columns, run count, then mean, std dev, min and max per column
+        # and finally the percentiles of the pooled sketches. Every block is padded to width columns
+        # (blank when a column has no values) so the blocks of short rows stay under their header.
+        with self.lock:
+            state = self.readState()
+        if width == None:
+            width = max([len(RunningStats(state[key]).count) for key in state] + [0])
+        summary = []
+        for key in sorted(state):
+            stats = RunningStats(state[key])
+            stdDev = stats.stdDev()
+            blocks = []
+            for values in [stats.mean, stdDev, stats.min, stats.max]:
+                block = [value if idx < len(stats.count) and stats.count[idx] > 0 else "" for idx, value in enumerate(values[0:width])]
+                blocks = blocks + block + [""] * (width - len(block))
+            pooled = self.returnPooledPercentiles(state[key].get("sketches", {}))
+            summary.append(key.split(",") + [stats.runs] + blocks + pooled)
+        return summary
+
+    def writeSummaryFile(self, summaryFileName, header=None, width=None):
+        # Several workers rewrite the same summary, write it under the lock and move it into place
+        with self.lock:
+            summary = self.returnSummary(width)
+            tempFileName = summaryFileName + ".tmp"
+            with open(tempFileName, 'w', newline='') as file:
+                writer = csv.writer(file)
+                if header != None:
+                    writer.writerow(header)
+                writer.writerows(summary)
+            os.replace(tempFileName, summaryFileName)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# Route the trips of a map once with duarouter and reuse the routes in every run.
+# Cached route files live in <map>/route_cache/ and are keyed by the hash of the network, the trip
+# file, the duarouter version and its options, so changing any of them routes again.
+# The maps use device.rerouting.adaptation-steps 0, i.e. SUMO routes at insertion on the empty
+# network, which is what duarouter does offline.
+#
+# python route_cache.py --maps tempe_2x3,arizona_highway_i_10
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+from filelock import FileLock
+import hashlib
+import optparse
+import os
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+if 'SUMO_HOME' in os.environ:
+    sys.path.append(os.path.join(os.environ['SUMO_HOME'], 'tools'))
+else:
+    sys.exit("please declare environment variable 'SUMO_HOME'")
+
+from sumolib import checkBinary  # noqa
+
+# Same error handling the maps' sumocfg asks for (ignore-route-errors), unroutable trips are dropped
+DUAROUTER_OPTIONS = ["--ignore-errors", "--no-warnings", "--no-step-log"]
+
+# A duarouter run taking longer is taken as hung, workers waiting for it give up a minute later
+# and SUMO routes the trips itself
+ROUTING_TIMEOUT_SECONDS = 1800
+LOCK_TIMEOUT_SECONDS = ROUTING_TIMEOUT_SECONDS + 60
+
+# A worker asks for the same map every test, hashes are kept per process by (path, size, mtime)
+# and the duarouter version is looked up once per binary
+fileHashes = {}
+duarouterVersions = {}
+
+
+def hashFile(fileName):
+    stat = os.stat(fileName)
+    fileKey = (os.path.abspath(fileName), stat.st_size, stat.st_mtime_ns)
+    if fileKey in fileHashes:
+        return fileHashes[fileKey]
+    sha = hashlib.sha1()
+    with open(fileName, 'rb') as file:
+        while True:
+            block = file.read(1 << 20)
+            if not block:
+                break
+            sha.update(block)
+    fileHashes[fileKey] = sha.hexdigest()
+    return fileHashes[fileKey]
+
+
+def readConfigInputs(configFileName):
+    # net-file and route-files of a sumocfg, relative paths resolved against the config's folder
+    configDirectory = os.path.dirname(configFileName)
+    inputs = ET.parse(configFileName).getroot().find('input')
+    netFileName = os.path.join(configDirectory, inputs.find('net-file').get('value'))
+    routeFileNames = [os.path.join(configDirectory, name.strip()) for name in inputs.find('route-files').get('value').split(",")]
+    return netFileName, routeFileNames
+
+
+class RouteCache:
+    def __init__(self, configFileName, cacheDirectory=None):
+        self.configFileName = configFileName
+        self.netFileName, self.tripFileNames = readConfigInputs(configFileName)
+        if cacheDirectory == None:
+            cacheDirectory = os.path.join(os.path.dirname(configFileName), "route_cache")
+        self.cacheDirectory = cacheDirectory
+        self.duarouterBinary = checkBinary('duarouter')
+
+    def duarouterVersion(self):
+        if self.duarouterBinary not in duarouterVersions:
+            process = subprocess.run([self.duarouterBinary, "--version"], stdout=subprocess.PIPE, universal_newlines=True)
+            duarouterVersions[self.duarouterBinary] = process.stdout.splitlines()[0] if process.stdout else ""
+        return duarouterVersions[self.duarouterBinary]
+
+    def returnKey(self):
+        sha = hashlib.sha1()
+        sha.update(hashFile(self.netFileName).encode())
+        for tripFileName in self.tripFileNames:
+            sha.update(hashFile(tripFileName).encode())
+        sha.update(self.duarouterVersion().encode())
+        sha.update(" ".join(DUAROUTER_OPTIONS).encode())
+        return sha.hexdigest()[0:16]
+
+    def routeFileName(self, key):
+        return os.path.join(self.cacheDirectory, "routes_" + key + ".rou.xml.gz")
+
+    def returnRouteFile(self):
+        # Path of the routed trips, routing them first if this network/trip combination is new
+        key = self.returnKey()
+        routeFileName = self.routeFileName(key)
+        if os.path.exists(routeFileName):
+            return routeFileName
+
+        os.makedirs(self.cacheDirectory, exist_ok=True)
+        # Workers starting together on a new map must not route the same trips at the same time
+        with FileLock(routeFileName + ".lock", timeout=LOCK_TIMEOUT_SECONDS):
+            if os.path.exists(routeFileName):
+                return routeFileName
+            print ( "Routing ", ",".join(self.tripFileNames), " on ", self.netFileName )
+            tempFileName = os.path.join(self.cacheDirectory, "routes_" + key + ".tmp.rou.xml.gz")
+            subprocess.run([self.duarouterBinary, "-n", self.netFileName, "-r", ",".join(self.tripFileNames),
+                            "-o", tempFileName] + DUAROUTER_OPTIONS, check=True, timeout=ROUTING_TIMEOUT_SECONDS)
+            os.replace(tempFileName, routeFileName)
+            # duarouter writes an .alt file next to the routes, it is not needed
+            altFileName = tempFileName.replace(".rou.xml.gz", ".rou.alt.xml.gz")
+            if os.path.exists(altFileName):
+                os.remove(altFileName)
+        return routeFileName
+
+
+def returnRouteFile(configFileName):
+    # Routed trips for the runner, None (route at insertion as before) when they cannot be built
+    try:
+        return RouteCache(configFileName).returnRouteFile()
+    except Exception as e:
+        print ( "Route cache unavailable, SUMO will route the trips itself ", str(e) )
+        return None
+
+
+def get_options():
+    optParser = optparse.OptionParser()
+    optParser.add_option("--maps", type="string", dest="maps", default="tempe_2x3,arizona_highway_i_10", help="Comma separated map folders under ../maps/")
+    optParser.add_option("--config_name", type="string", dest="config_name", default="osm.sumocfg", help="SUMO config inside every map folder")
+    options, args = optParser.parse_args()
+    return options
+
+
+# this is the main entry point of this script
+if __name__ == "__main__":
+    options = get_options()
+    for mapName in options.maps.split(","):
+        print ( mapName, ": ", RouteCache(os.path.join("../maps", mapName, options.config_name)).returnRouteFile() )
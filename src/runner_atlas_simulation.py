@@ -28,11 +28,18 @@ if 'SUMO_HOME' in os.environ:
     tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
     sys.path.append(tools)
 else:
-    sys.exit("please declare environment variable 'SUMO_HOME'")
+    # Same exit as any other configuration error, the GUI does not restart on it
+    print ( "please declare environment variable 'SUMO_HOME'" )
+    sys.exit(-99)
 
 from sumolib import checkBinary  # noqa
 import traci  # noqa
 import sumolib.net  # noqa
+import traci_metrics  # noqa
+import route_cache  # noqa
+import vehicle_type_assignment  # noqa
+import traffic_lights  # noqa
+import worker_telemetry  # noqa
 
 
 def engage_timer():
@@ -44,7 +51,7 @@ def calculate_and_print_time(start):
     print(" ::::Elapsed Time: ", elapsed_time)
 
 
-def run(simulation, test_settings_container, thread_management_sheet):
+def run(simulation, test_settings_container, thread_management_sheet, metric_collector=None, vehicle_types=None, traffic_light_service=None, signal_controller=None, telemetry=None):
     """execute the TraCI control loop"""
     step = 0
 
@@ -77,6 +84,18 @@ def run(simulation, test_settings_container, thread_management_sheet):
         # Also calculate if the vehicle is an CAV due to probability
         if step >= 1:
             for count in range(0, len(curList)):
+                if vehicle_types != None:
+                    # Types are already in the route file, only keep track of which vehicles are AVs and CAVs
+                    vehicleType = vehicle_types.returnType(curList[count])
+                    if vehicleType == vehicle_type_assignment.CAV_TYPE:
+                        totalCAVs = totalCAVs + 1
+                        cav_list_all.append(curList[count])
+                    elif vehicleType != None:
+                        totalAVs = totalAVs + 1
+                        av_list_all.append(curList[count])
+                    if vehicleType != None and traffic_light_service != None:
+                        traffic_light_service.track(curList[count])
+                    continue
                 randomnum = random.random()
                 if (test_settings_container.avProbability != 0) and (randomnum <= test_settings_container.avProbability):
                     try:
@@ -89,6 +108,8 @@ def run(simulation, test_settings_container, thread_management_sheet):
                         totalAVs = totalAVs + 1
                         # This is an AV, add to AV list
                         av_list_all.append(curList[count])
+                        if traffic_light_service != None:
+                            traffic_light_service.track(curList[count])
                     except:
                         print("Couldn't add AV ")
                 # (randomnum > testContainer.avProbability) is implied here because it passed the first if statement
@@ -100,6 +121,8 @@ def run(simulation, test_settings_container, thread_management_sheet):
                         totalCAVs = totalCAVs + 1
                         # Add to CAV list
                         cav_list_all.append(curList[count])
+                        if traffic_light_service != None:
+                            traffic_light_service.track(curList[count])
                     except:
                         print("Couldn't add CAV ")
 
@@ -109,6 +132,14 @@ def run(simulation, test_settings_container, thread_management_sheet):
         av_list = list(set(av_list_all) & set(vehicleIDList))
         cav_list = list(set(cav_list_all) & set(vehicleIDList))
 
+        # Signals within the view distance ahead of every AV/CAV, in traffic_light_service.signals
+        if traffic_light_service != None:
+            traffic_light_service.update(av_list + cav_list)
+
+        # Extend or cut the green phases of every signal from the queues on their lanes
+        if signal_controller != None:
+            signal_controller.update()
+
         # Car following model modification
         if not test_settings_container.trafficSet:
             try:
@@ -139,6 +170,10 @@ def run(simulation, test_settings_container, thread_management_sheet):
         print ( "Step " , step )
         
         simulation.simulationStep()
+
+        # Pick up departures, arrivals and per vehicle values for the in-run metrics
+        if metric_collector != None:
+            metric_collector.step()
         
         # Finally we have finished an iteration, increment step
         step += 1
@@ -155,6 +190,10 @@ def run(simulation, test_settings_container, thread_management_sheet):
             print ( " Average loop execution time (seconds): " , estimator)
             estimator = estimator*((4200/test_settings_container.timestep)-step)/60 # Our tests are currently averaging about 3600 second + 200
             print ( " Estimated completion time (minutes): " , estimator)
+
+        # Live progress for the GUI, rate limited by the publisher
+        if telemetry != None:
+            telemetry.publish(step, step*test_settings_container.timestep, len(vehicleIDList), max(0.0, estimator*60))
             
         if (lastCheckTime-fiveMinuteTester) >= 300:
             fiveMinuteTester = lastCheckTime
@@ -184,6 +223,12 @@ def get_options():
     # Spread test multi options
     optParser.add_option("--testname", type="string", dest="testname", help="Name of file to read test data from")
     optParser.add_option("--thread_management_sheet", type="string", dest="thread_management_sheet", help="Google sheets ID for the sheet to monitor threads")
+    optParser.add_option("--telemetry_port", type="int", dest="telemetry_port", default=None, help="send live progress to the GUI listening on this local UDP port")
+    optParser.add_option("--tfl_distance", type="float", dest="tfl_distance", default=0.0, help="look this many metres ahead of every AV/CAV for traffic lights, 0 turns it off")
+    optParser.add_option("--adaptive_tls", action="store_true", default=False, help="load the map's tlsAdaptation.add.xml and adapt its phases to the lane queues within minDur/maxDur")
+    optParser.add_option("--pretyped", action="store_true", default=False, help="write the AV/CAV types into a per test route file before the run instead of changing them over TraCI")
+    optParser.add_option("--no_route_cache", action="store_true", default=False, help="let SUMO route the raw trips at insertion instead of loading the cached routes")
+    optParser.add_option("--traci_metrics", action="store_true", default=False, help="collect the trip and emission metrics over TraCI during the run instead of writing and parsing tripinfo XML")
     options, args = optParser.parse_args()
     return options
 
@@ -208,10 +253,14 @@ if __name__ == "__main__":
     # Create the test container
     test_settings_container = input_output_parsing.ATLASTestContainer(testPortID)
 
-    if len(options.testname) <= 0:
+    if options.testname == None or len(options.testname) <= 0:
         print ( "ERROR: test name required " )
         sys.exit(-99)
 
+    telemetry = None
+    if options.telemetry_port != None:
+        telemetry = worker_telemetry.TelemetryPublisher(options.telemetry_port, testPortID)
+
     # Write the thread header to sheets if it is set
     test_settings_container.writeThreadStartSheets(options.thread_management_sheet, time.time())
 
@@ -219,18 +268,60 @@ if __name__ == "__main__":
 
     # Infinite while to keep checking for tests
     while 1:
+        # Heartbeats let the GUI restart a worker that stops making progress anywhere, e.g. in a Sheets retry
+        if telemetry != None:
+            telemetry.heartbeat("reading", runIDX)
         while test_settings_container.readNextInputParallelGoogleSheets(options.testname) == True:
+            if telemetry != None:
+                telemetry.heartbeat("starting", runIDX)
 
-            temp_xml_file_name = xmlFileName + str(runIDX) + "simulation_tripinfo.xml"
-            temp_crash_xml_file_name = xmlFileName + str(runIDX) + "simulation_crashinfo.xml"
+            # SUMO compresses these itself because of the .gz ending, xml_parser reads them as is
+            temp_xml_file_name = xmlFileName + str(runIDX) + "simulation_tripinfo.xml.gz"
+            temp_crash_xml_file_name = xmlFileName + str(runIDX) + "simulation_crashinfo.xml.gz"
 
             # Write the thread info to sheets if it is set
             test_settings_container.writeThreadUpdateSheets(options.thread_management_sheet, time.time(), 0)
 
+            # Routing (or waiting for another worker to route) can take minutes on a large map
+            with worker_telemetry.busy(telemetry, "starting", runIDX):
+                # Trips routed once per network/trip file instead of at every insertion in every run
+                routeOptions = []
+                if not options.no_route_cache:
+                    routeFileName = route_cache.returnRouteFile(test_settings_container.simmapname)
+                    if routeFileName != None:
+                        routeOptions = ["--route-files", routeFileName]
+
+                vehicle_types = None
+                if options.pretyped:
+                    # Seeded the same way run() seeds its own random, so the same test always gets the same AVs and CAVs
+                    if len(routeOptions) > 0:
+                        sourceFileNames = [routeOptions[1]]
+                    else:
+                        sourceFileNames = route_cache.readConfigInputs(test_settings_container.simmapname)[1]
+                    vehicle_types = vehicle_type_assignment.VehicleTypeAssignment(sourceFileNames, test_settings_container.avProbability,
+                                                                                  test_settings_container.cavProbability, test_settings_container.trafficSet)
+                    routeOptions = ["--route-files", ",".join(vehicle_types.prepare())]
+
+            # Signal programs with minDur/maxDur for the adaptive controller, they are not part of the map's config
+            additionalOptions = []
+            programFileName = os.path.join(os.path.dirname(test_settings_container.simmapname), "tlsAdaptation.add.xml")
+            if options.adaptive_tls:
+                if os.path.exists(programFileName):
+                    additionalOptions = traffic_lights.returnAdditionalOptions(test_settings_container.simmapname, programFileName)
+                else:
+                    print ( "No signal programs for adaptive control ", programFileName )
+
             # this is the normal way of using traci. sumo is started as a
             # subprocess and then the python script connects and runs
-            if test_settings_container.logEmisisonsData:
-                traci.start([sumoBinary, "-c", test_settings_container.simmapname,
+            if test_settings_container.logEmisisonsData and options.traci_metrics:
+                # Metrics come from TraCI subscriptions, only the (small) collision output is written
+                traci.start([sumoBinary, "-c", test_settings_container.simmapname] + routeOptions + additionalOptions + [
+                             "--collision-output", temp_crash_xml_file_name,
+                             "--collision.action", "teleport",
+                             "--duration-log.statistics", "--scale", str(test_settings_container.scale),
+                             "--step-length", str(test_settings_container.timestep)], label=simulationName)
+            elif test_settings_container.logEmisisonsData:
+                traci.start([sumoBinary, "-c", test_settings_container.simmapname] + routeOptions + additionalOptions + [
                              "--collision-output", temp_crash_xml_file_name,
                              "--collision.action", "teleport",
                              "--duration-log.statistics", "--tripinfo-output", temp_xml_file_name,
@@ -238,46 +329,87 @@ if __name__ == "__main__":
                              "--step-length", str(test_settings_container.timestep)], label=simulationName)
             else:
                 # We are not logging anything unnecessary to reduce the workload
-                traci.start([sumoBinary, "-c", test_settings_container.simmapname,
+                traci.start([sumoBinary, "-c", test_settings_container.simmapname] + routeOptions + additionalOptions + [
                             "--scale", str(test_settings_container.scale), "--step-length", str(test_settings_container.timestep)], label=simulationName)
 
             # Select the correct traci
             simulation = traci.getConnection(simulationName)
 
+            metric_collector = None
+            if test_settings_container.logEmisisonsData and options.traci_metrics:
+                metric_collector = traci_metrics.TraCIMetricCollector(simulation, test_settings_container.timestep)
+
+            traffic_light_service = None
+            test_settings_container.trafficLightViewDistance = options.tfl_distance
+            if test_settings_container.trafficLightViewDistance > 0:
+                try:
+                    # Both of them subscribe to the same vehicles, the later subscription has to carry all variables
+                    extraVariables = traci_metrics.VEHICLE_VARIABLES if metric_collector != None else None
+                    # The first build of the index reads the whole network
+                    with worker_telemetry.busy(telemetry, "starting", runIDX):
+                        index = traffic_lights.loadTrafficLightIndex(test_settings_container.simmapname)
+                    traffic_light_service = traffic_lights.TrafficLightService(simulation, index, test_settings_container.trafficLightViewDistance, extraVariables)
+                except Exception as e:
+                    print ( "Traffic light index unavailable ", str(e) )
+
+            signal_controller = None
+            if len(additionalOptions) > 0:
+                signal_controller = traffic_lights.AdaptiveSignalController(simulation, programFileName, test_settings_container.timestep)
+
             # Run the simulator
-            returnedData = run(simulation, test_settings_container, options.thread_management_sheet)
+            returnedData = run(simulation, test_settings_container, options.thread_management_sheet, metric_collector, vehicle_types, traffic_light_service, signal_controller, telemetry)
 
-            # Sleep here to allow for data export from the controller
-            time.sleep(2)
+            if telemetry != None:
+                telemetry.heartbeat("results", runIDX)
+
+            if metric_collector == None:
+                # Sleep here to allow for data export from the controller
+                time.sleep(2)
 
             # Close and sleep for some time to allow time for the server to reset
             traci.close()
             
             time.sleep(5)
 
-            # Parse our output file and get the data
-            try:
-                if test_settings_container.logEmisisonsData:
-                    sumoparser = xml_parser.SUMOOutputParser(temp_xml_file_name)
-                    xmlData = sumoparser.returnParsedDataGoogleSheets()
-                    sumoparser2 = xml_parser.CollisionOutputParser(temp_crash_xml_file_name)
-                    collisions = sumoparser2.returnParsedData()
-            except Exception as e:
-                print ( e )
-                xmlData = ["xml data error"]
-
-            if test_settings_container.logEmisisonsData:
-                test_settings_container.writeOutputFileGoogleSheets(returnedData, options.filename, xmlData, collisions)
-            else:
-                test_settings_container.writeOutputFileGoogleSheets(returnedData, options.filename, None, None)
+            xmlData = None
+            collisions = None
+            parseFailed = False
+            with worker_telemetry.busy(telemetry, "results", runIDX):
+                # Parse our output file and get the data
+                try:
+                    if test_settings_container.logEmisisonsData:
+                        if metric_collector != None:
+                            xmlData = metric_collector.returnParsedDataGoogleSheets()
+                        else:
+                            sumoparser = xml_parser.SUMOOutputParser(temp_xml_file_name)
+                            xmlData = sumoparser.returnParsedDataGoogleSheets()
+                        sumoparser2 = xml_parser.CollisionOutputParser(temp_crash_xml_file_name)
+                        collisions = sumoparser2.returnParsedData()
+                except Exception as e:
+                    # The sheet still gets the TraCI stats of this run, the statistics leave it out
+                    print ( "xml data error ", e )
+                    xmlData = None
+                    collisions = None
+                    parseFailed = True
+
+            test_settings_container.writeOutputFileGoogleSheets(returnedData, options.filename, xmlData, collisions)
+            if not parseFailed:
+                test_settings_container.writeOutputFileRunningStats(returnedData, options.filename, xmlData, collisions)
+                test_settings_container.writeOutputFileColumnar(returnedData, options.filename, xmlData, collisions)
 
             runIDX = runIDX + 1
             time.sleep(2)
 
+            if telemetry != None:
+                telemetry.heartbeat("reading", runIDX)
+
         print ( "All tests complete! Checking again in 5 minutes... ")
 
         test_settings_container.writeThreadUpdateSheets(options.thread_management_sheet, time.time(), 0)
 
+        # Waiting on purpose, the GUI does not count this as a stall
+        if telemetry != None:
+            telemetry.heartbeat("idle", runIDX)
         time.sleep(300)
 
         # Reset the test parser index so we begin again
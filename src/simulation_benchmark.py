@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# End to end benchmark of a full test on the bundled maps, headless and with fixed seeds.
+# Every map / scale / AV-CAV mix runs in its own process (so peak memory is per case) with the
+# same SUMO options the runner uses when logging emissions. Wall time, simulated seconds per wall
+# second, TraCI calls, peak memory of the controller and of SUMO and the time spent parsing the
+# outputs are written to JSON and compared against a stored baseline to flag slowdowns.
+#
+# python simulation_benchmark.py --scales 0.5,1 --end 900 --baseline ../output/simulation_benchmark_baseline.json
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import contextlib
+import json
+import optparse
+import os
+import subprocess
+import sys
+import time
+import route_cache
+import runner_atlas_simulation
+import xml_parser
+from controller_benchmark import BenchmarkTestContainer
+from parser_benchmark import peakMemory
+from sumolib import checkBinary  # noqa
+import traci  # noqa
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class CountingDomain:
+    def __init__(self, domain, connection):
+        # Passes every call through to the real TraCI domain and counts it
+        self.domain = domain
+        self.connection = connection
+
+    def __getattr__(self, name):
+        attribute = getattr(self.domain, name)
+        if not callable(attribute):
+            return attribute
+
+        def countedCall(*args, **kwargs):
+            self.connection.calls += 1
+            return attribute(*args, **kwargs)
+        return countedCall
+
+
+class CountingConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.calls = 0
+        self.vehicle = CountingDomain(connection.vehicle, self)
+        self.simulation = CountingDomain(connection.simulation, self)
+
+    def simulationStep(self, step=0.0):
+        self.calls += 1
+        return self.connection.simulationStep(step)
+
+
+def childPeakMemory():
+    # Peak resident set size of the biggest finished child process (SUMO) in bytes
+    if resource == None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+
+def runInWorker(case, directory):
+    # Runs in the child process: one complete test the way the runner does it, then the parse
+    caseName = caseKey(case)
+    tripInfoFileName = os.path.join(directory, caseName + "_tripinfo.xml.gz")
+    crashInfoFileName = os.path.join(directory, caseName + "_crashinfo.xml.gz")
+    container = BenchmarkTestContainer(case["avProbability"], case["cavProbability"], case["trafficSet"])
+    container.mapname = "../maps/" + case["map"]
+    container.simmapname = container.mapname + "/" + case["config"]
+    container.scale = case["scale"]
+    container.timestep = case["timestep"]
+
+    command = [checkBinary('sumo'), "-c", container.simmapname,
+               "--seed", str(case["seed"]),
+               "--collision-output", crashInfoFileName,
+               "--collision.action", "teleport",
+               "--duration-log.statistics", "--tripinfo-output", tripInfoFileName,
+               "--device.emissions.probability", "1.0", "--scale", str(container.scale),
+               "--step-length", str(container.timestep)]
+    if case["end"] != None:
+        command = command + ["--end", str(case["end"])]
+    if case["routeCache"]:
+        # Routing happens before the clock starts, the runner does it once per map as well
+        routeFileName = route_cache.returnRouteFile(container.simmapname)
+        if routeFileName != None:
+            command = command + ["--route-files", routeFileName]
+
+    startTime = time.perf_counter()
+    traci.start(command, label=caseName)
+    simulation = CountingConnection(traci.getConnection(caseName))
+    # run() prints every step, that is not part of what we measure
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        returnedData = runner_atlas_simulation.run(simulation, container, None)
+    simulatedSeconds = simulation.connection.simulation.getTime()
+    traci.switch(caseName)
+    traci.close()
+    wallSeconds = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    xmlData = xml_parser.SUMOOutputParser(tripInfoFileName).returnParsedDataGoogleSheets()
+    collisions = xml_parser.CollisionOutputParser(crashInfoFileName).returnParsedData()
+    parseSeconds = time.perf_counter() - startTime
+
+    return {"wallSeconds": wallSeconds, "simulatedSeconds": simulatedSeconds,
+            "simulatedSecondsPerWallSecond": simulatedSeconds / wallSeconds,
+            "traciCalls": simulation.calls, "parseSeconds": parseSeconds,
+            "controllerPeakMemory": peakMemory(), "sumoPeakMemory": childPeakMemory(),
+            "totalVehicles": xmlData.totalVehicles, "totalAVs": returnedData["totalAVs"],
+            "totalCAVs": returnedData["totalCAVs"], "collisions": collisions}
+
+
+def caseKey(case):
+    return "%s_%s_scale%s_av%s_cav%s_ts%s_seed%d" % (case["map"], case["config"].replace(".sumocfg", ""), case["scale"], case["avProbability"], case["cavProbability"], case["trafficSet"], case["seed"])
+
+
+def runCase(case, directory):
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", json.dumps(case), "--directory", directory],
+                             stdout=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        print ( "Case failed: ", caseKey(case) )
+        return None
+    result = dict(case)
+    result.update(json.loads(process.stdout.strip().splitlines()[-1]))
+    return result
+
+
+def compareToBaseline(results, baselineFileName, tolerance):
+    # Slower wall time beyond tolerance is flagged, a different TraCI call count means the controller changed
+    with open(baselineFileName, 'r') as file:
+        baseline = {caseKey(case): case for case in json.load(file)["cases"]}
+    slower = []
+    for result in results:
+        previous = baseline.get(caseKey(result))
+        if previous == None:
+            print ( " ", caseKey(result), " not in the baseline" )
+            continue
+        ratio = result["wallSeconds"] / previous["wallSeconds"]
+        parseRatio = result["parseSeconds"] / previous["parseSeconds"]
+        print ( " ", caseKey(result), " wall time vs baseline: ", round(ratio, 3), " parse time vs baseline: ", round(parseRatio, 3),
+                " TraCI calls: ", result["traciCalls"], " (baseline ", previous["traciCalls"], ")" )
+        if ratio > 1 + tolerance or parseRatio > 1 + tolerance:
+            slower.append(caseKey(result))
+    return slower
+
+
+def writeResults(fileName, results):
+    os.makedirs(os.path.dirname(os.path.abspath(fileName)), exist_ok=True)
+    tempFileName = fileName + ".tmp"
+    with open(tempFileName, 'w') as file:
+        json.dump({"python": sys.version.split()[0], "platform": sys.platform, "timestamp": time.time(), "cases": results}, file, indent=1)
+    os.replace(tempFileName, fileName)
+
+
+def get_options():
+    optParser = optparse.OptionParser()
+    optParser.add_option("--maps", type="string", dest="maps", default="tempe_2x3,arizona_highway_i_10", help="Comma separated map folders under ../maps/")
+    optParser.add_option("--config_name", type="string", dest="config_name", default="osm.sumocfg", help="SUMO config inside every map folder, e.g. one written by demand_generator.py")
+    optParser.add_option("--scales", type="string", dest="scales", default="0.5,1", help="Comma separated demand scales")
+    optParser.add_option("--penetrations", type="string", dest="penetrations", default="0:0,0.2:0.2,0.1:0.6", help="Comma separated avProbability:cavProbability pairs")
+    optParser.add_option("--traffic_set", type="int", dest="traffic_set", default=0, help="trafficSet of the tests")
+    optParser.add_option("--timestep", type="float", dest="timestep", default=1.0, help="SUMO step length")
+    optParser.add_option("--seed", type="int", dest="seed", default=42, help="SUMO seed, the controller always seeds its own random with 10")
+    optParser.add_option("--no_route_cache", action="store_true", default=False, help="let SUMO route the raw trips instead of loading the cached routes")
+    optParser.add_option("--end", type="int", dest="end", default=None, help="Stop every simulation at this time (seconds) to keep the benchmark short")
+    optParser.add_option("--directory", type="string", dest="directory", default="../output/simulation_benchmark/", help="Where SUMO writes the outputs of the cases")
+    optParser.add_option("--output", type="string", dest="output", default="../output/simulation_benchmark.json", help="JSON file the results are written to")
+    optParser.add_option("--baseline", type="string", dest="baseline", default=None, help="Baseline JSON file to compare against")
+    optParser.add_option("--update_baseline", action="store_true", default=False, help="Write the results to --baseline instead of comparing")
+    optParser.add_option("--tolerance", type="float", dest="tolerance", default=0.2, help="Allowed slowdown against the baseline, 0.2 is 20%")
+    # Used internally to run one case in a fresh process
+    optParser.add_option("--worker", type="string", dest="worker", default=None, help=optparse.SUPPRESS_HELP)
+    options, args = optParser.parse_args()
+    return options
+
+
+# this is the main entry point of this script
+if __name__ == "__main__":
+    options = get_options()
+
+    if options.worker != None:
+        print ( json.dumps(runInWorker(json.loads(options.worker), options.directory)) )
+        sys.exit(0)
+
+    os.makedirs(options.directory, exist_ok=True)
+    results = []
+    for mapName in options.maps.split(","):
+        for scale in [float(scale) for scale in options.scales.split(",")]:
+            for penetration in options.penetrations.split(","):
+                avProbability, cavProbability = [float(value) for value in penetration.split(":")]
+                case = {"map": mapName, "config": options.config_name, "scale": scale, "avProbability": avProbability, "cavProbability": cavProbability,
+                        "trafficSet": options.traffic_set, "timestep": options.timestep, "seed": options.seed, "end": options.end,
+                        "routeCache": not options.no_route_cache}
+                print ( "Running ", caseKey(case) )
+                result = runCase(case, options.directory)
+                if result == None:
+                    continue
+                results.append(result)
+                print ( " wall seconds: ", round(result["wallSeconds"], 1), " sim s/wall s: ", round(result["simulatedSecondsPerWallSecond"], 1),
+                        " TraCI calls: ", result["traciCalls"], " parse seconds: ", round(result["parseSeconds"], 2),
+                        " SUMO peak memory: ", result["sumoPeakMemory"] )
+
+    writeResults(options.output, results)
+    print ( "Results written to ", options.output )
+
+    if options.baseline != None:
+        if options.update_baseline or not os.path.exists(options.baseline):
+            writeResults(options.baseline, results)
+            print ( "Baseline written to ", options.baseline )
+        else:
+            slower = compareToBaseline(results, options.baseline, options.tolerance)
+            if len(slower) > 0:
+                print ( "Slower than the baseline: ", slower )
+                sys.exit(1)
@@ -0,0 +1,98 @@
+from filelock import FileLock
+import json
+import os
+import time
+
+
+class SpecSheetCache:
+    def __init__(self, sheetKey, cacheDirectory="../output/", refreshInterval=120):
+        self.sheetKey = sheetKey
+        self.cacheFileName = os.path.join(cacheDirectory, str(sheetKey) + "_spec_cache.json")
+        self.refreshInterval = refreshInterval
+
+        # Full copy of the spec sheet as returned by get_all_values, rows and columns start at 1 like gspread
+        self.values = []
+        self.lastRefresh = 0.0
+
+        # Set whenever we find out the copy is out of date (e.g. somebody else claimed our test)
+        self.invalid = True
+
+    def isStale(self):
+        return self.invalid or (time.time() - self.lastRefresh) > self.refreshInterval
+
+    def invalidate(self):
+        self.invalid = True
+
+    def load(self):
+        # Another worker on this machine may have refreshed the copy on disk recently
+        if not os.path.exists(self.cacheFileName):
+            return False
+        with FileLock(self.cacheFileName + ".lock"):
+            try:
+                with open(self.cacheFileName, 'r') as file:
+                    cached = json.load(file)
+            except Exception as e:
+                print ( "Spec cache unreadable, ignoring ", str(e) )
+                return False
+        if (time.time() - cached["timestamp"]) > self.refreshInterval:
+            return False
+        self.values = cached["values"]
+        self.lastRefresh = cached["timestamp"]
+        self.invalid = False
+        return True
+
+    def store(self, values):
+        self.values = values
+        self.lastRefresh = time.time()
+        self.invalid = False
+        self.save()
+
+    def save(self):
+        directory = os.path.dirname(self.cacheFileName)
+        if directory != "" and not os.path.exists(directory):
+            os.makedirs(directory)
+        with FileLock(self.cacheFileName + ".lock"):
+            # Write to a temp file first so a crash never leaves a half written cache behind
+            tempFileName = self.cacheFileName + ".tmp"
+            with open(tempFileName, 'w') as file:
+                json.dump({"timestamp": self.lastRefresh, "values": self.values}, file)
+            os.replace(tempFileName, self.cacheFileName)
+
+    def sync(self, worksheet, container, force=False):
+        # Returns True if we had to go to the sheet for a fresh copy
+        if not force and not self.isStale():
+            return False
+        if not force and self.load():
+            return False
+        self.store(container.trygetallvalues(worksheet))
+        return True
+
+    def cell(self, row, col):
+        if row - 1 < len(self.values) and col - 1 < len(self.values[row - 1]):
+            return self.values[row - 1][col - 1]
+        return ''
+
+    def setCell(self, row, col, val, save=True):
+        # Keep our copy in line with what we just wrote to the sheet, callers updating several cells save once at the end
+        while len(self.values) < row:
+            self.values.append([])
+        while len(self.values[row - 1]) < col:
+            self.values[row - 1].append('')
+        self.values[row - 1][col - 1] = str(val)
+        if save:
+            self.save()
+
+    def column(self, col):
+        return [self.cell(row + 1, col) for row in range(len(self.values))]
+
+    def nextTestIdx(self, iterationsRow=2):
+        # Same scan as the sheet based lookup, the first column with iterations left wins
+        idx = 2
+        while True:
+            try:
+                val = int(self.cell(iterationsRow, idx))
+            except:
+                return -1
+            if val > 0:
+                return idx
+            idx = idx + 1
@@ -0,0 +1,70 @@
+import traci.constants as tc
+import xml_parser
+
+# Per vehicle values we subscribe to, one batched read per step covers every vehicle
+VEHICLE_VARIABLES = [tc.VAR_TYPE, tc.VAR_SPEED, tc.VAR_TIMELOSS, tc.VAR_DISTANCE,
+                     tc.VAR_CO2EMISSION, tc.VAR_COEMISSION, tc.VAR_HCEMISSION, tc.VAR_NOXEMISSION,
+                     tc.VAR_PMXEMISSION, tc.VAR_FUELCONSUMPTION, tc.VAR_ELECTRICITYCONSUMPTION]
+
+# Emission rates per second, in xml_parser.EMISSION_ATTRIBUTES order
+EMISSION_VARIABLES = [tc.VAR_CO2EMISSION, tc.VAR_COEMISSION, tc.VAR_HCEMISSION, tc.VAR_NOXEMISSION,
+                      tc.VAR_PMXEMISSION, tc.VAR_FUELCONSUMPTION, tc.VAR_ELECTRICITYCONSUMPTION]
+
+# Same threshold SUMO uses for the tripinfo waitingTime
+WAITING_SPEED = 0.1
+
+
+class VehicleTrip:
+    def __init__(self, depart):
+        self.depart = depart
+        self.vType = None
+        self.timeLoss = 0.0
+        self.routeLength = 0.0
+        self.waitingTime = 0.0
+        self.emissions = [0.0] * len(EMISSION_VARIABLES)
+
+
+class TraCIMetricCollector:
+    def __init__(self, simulation, stepLength):
+        # Builds the same statistics as parsing tripinfo + emissions output, but from subscriptions
+        # while the vehicles drive, so no output XML has to be written or parsed
+        self.simulation = simulation
+        self.stepLength = stepLength
+        self.trips = {}
+        self.accumulator = xml_parser.TripAccumulator()
+        self.simulation.simulation.subscribe([tc.VAR_TIME, tc.VAR_DEPARTED_VEHICLES_IDS, tc.VAR_ARRIVED_VEHICLES_IDS])
+
+    def step(self):
+        # Call once after every simulationStep
+        simulationResults = self.simulation.simulation.getSubscriptionResults()
+        # Departures and arrivals happened in the step that just ended
+        stepTime = simulationResults[tc.VAR_TIME] - self.stepLength
+
+        for vehicleID in simulationResults[tc.VAR_DEPARTED_VEHICLES_IDS]:
+            self.simulation.vehicle.subscribe(vehicleID, VEHICLE_VARIABLES)
+            self.trips[vehicleID] = VehicleTrip(stepTime)
+
+        vehicleResults = self.simulation.vehicle.getAllSubscriptionResults()
+        for vehicleID, values in vehicleResults.items():
+            trip = self.trips.get(vehicleID)
+            if trip == None:
+                continue
+            trip.vType = values[tc.VAR_TYPE]
+            trip.timeLoss = values[tc.VAR_TIMELOSS]
+            trip.routeLength = values[tc.VAR_DISTANCE]
+            if values[tc.VAR_SPEED] <= WAITING_SPEED:
+                trip.waitingTime = trip.waitingTime + self.stepLength
+            # Rates are per second, the tripinfo values are totals over the trip
+            for idx, variable in enumerate(EMISSION_VARIABLES):
+                trip.emissions[idx] = trip.emissions[idx] + values[variable] * self.stepLength
+
+        for vehicleID in simulationResults[tc.VAR_ARRIVED_VEHICLES_IDS]:
+            trip = self.trips.pop(vehicleID, None)
+            if trip == None:
+                continue
+            duration = stepTime - trip.depart
+            self.accumulator.addValues([trip.timeLoss, trip.waitingTime, trip.routeLength, duration], trip.emissions, trip.vType)
+
+    def returnParsedDataGoogleSheets(self):
+        # Vehicles still driving when the run ends have no tripinfo either, they are left out the same way
+        return self.accumulator.returnResult()
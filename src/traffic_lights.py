@@ -0,0 +1,262 @@
+import os
+import pickle
+import traci.constants as tc
+import xml.etree.ElementTree as ET
+import sumolib.net
+import route_cache
+
+# Per vehicle values needed to place a vehicle on the network, read with one batched call per step
+VEHICLE_VARIABLES = [tc.VAR_LANE_ID, tc.VAR_LANEPOSITION, tc.VAR_ROUTE_INDEX]
+# Signal values, the service and the adaptive controller subscribe the same signals with the same list
+TLS_VARIABLES = [tc.TL_RED_YELLOW_GREEN_STATE, tc.TL_CURRENT_PHASE]
+# Per controlled lane values the adaptive controller decides on
+LANE_VARIABLES = [tc.LAST_STEP_OCCUPANCY, tc.LAST_STEP_VEHICLE_HALTING_NUMBER]
+
+
+class TrafficLightIndex:
+    def __init__(self, netFileName, tflListFileName=None):
+        # Lane/edge lengths and which signal (tls id, link index) sits at the end of a lane towards a next edge.
+        # The links come from tflList.p (getControlledLinks of every signal) when the map has one, otherwise from the net.
+        net = sumolib.net.readNet(netFileName, withInternal=True)
+        self.laneLength = {}
+        self.edgeLength = {}
+        for edge in net.getEdges(withInternal=True):
+            for lane in edge.getLanes():
+                self.laneLength[lane.getID()] = lane.getLength()
+            self.edgeLength[edge.getID()] = edge.getLanes()[0].getLength()
+
+        # (incoming lane, next edge) and (incoming edge, next edge) to (tls id, link index)
+        self.laneLinks = {}
+        self.edgeLinks = {}
+        # tls id to its controlled incoming lanes
+        self.controlledLanes = {}
+        if tflListFileName != None and os.path.exists(tflListFileName):
+            with open(tflListFileName, 'rb') as file:
+                for links in pickle.load(file):
+                    for linkIndex, link in enumerate(links):
+                        for inLane, outLane, via in link:
+                            # Internal lanes are named :<junction>_<link>_<lane>, the signal carries the junction's id
+                            self.addLink(via[1:].rsplit("_", 2)[0], linkIndex, inLane, outLane)
+        else:
+            for tls in net.getTrafficLights():
+                for inLane, outLane, linkIndex in tls.getConnections():
+                    self.addLink(tls.getID(), linkIndex, inLane.getID(), outLane.getID())
+
+    def addLink(self, tlsID, linkIndex, inLane, outLane):
+        inEdge = inLane.rsplit("_", 1)[0]
+        outEdge = outLane.rsplit("_", 1)[0]
+        self.laneLinks.setdefault((inLane, outEdge), (tlsID, linkIndex))
+        # A vehicle at the end of its route still stops at the light, any link of the lane will do
+        self.laneLinks.setdefault((inLane, None), (tlsID, linkIndex))
+        self.edgeLinks.setdefault((inEdge, outEdge), (tlsID, linkIndex))
+        self.edgeLinks.setdefault((inEdge, None), (tlsID, linkIndex))
+        self.controlledLanes.setdefault(tlsID, [])
+        if inLane not in self.controlledLanes[tlsID]:
+            self.controlledLanes[tlsID].append(inLane)
+
+
+def loadTrafficLightIndex(configFileName):
+    # Reading a large net takes a while, the index is kept per network hash next to the route cache
+    mapDirectory = os.path.dirname(configFileName)
+    netFileName = route_cache.readConfigInputs(configFileName)[0]
+    cacheDirectory = os.path.join(mapDirectory, "route_cache")
+    indexFileName = os.path.join(cacheDirectory, "tls_index_" + route_cache.hashFile(netFileName)[0:16] + ".p")
+    if os.path.exists(indexFileName):
+        with open(indexFileName, 'rb') as file:
+            return pickle.load(file)
+
+    index = TrafficLightIndex(netFileName, os.path.join(mapDirectory, "tflList.p"))
+    os.makedirs(cacheDirectory, exist_ok=True)
+    tempFileName = indexFileName + ".tmp" + str(os.getpid())
+    with open(tempFileName, 'wb') as file:
+        pickle.dump(index, file)
+    os.replace(tempFileName, indexFileName)
+    return index
+
+
+class TrafficLightService:
+    def __init__(self, simulation, index, viewDistance, extraVehicleVariables=None):
+        # Answers "which signal is within viewDistance metres ahead" for all tracked vehicles at once.
+        # extraVehicleVariables keeps other subscriptions on the same vehicles (e.g. traci_metrics) alive,
+        # a new subscription replaces the variables of an older one.
+        self.simulation = simulation
+        self.index = index
+        self.viewDistance = viewDistance
+        self.vehicleVariables = list(VEHICLE_VARIABLES)
+        if extraVehicleVariables != None:
+            self.vehicleVariables = self.vehicleVariables + [variable for variable in extraVehicleVariables if variable not in VEHICLE_VARIABLES]
+        self.routes = {}
+        # Vehicle id to (tls id, distance in metres, signal state character) of the last update
+        self.signals = {}
+        # Ids derived from tflList.p are junction ids, joined signals can be named differently in the simulation
+        knownSignals = set(self.simulation.trafficlight.getIDList())
+        for tlsID in self.index.controlledLanes:
+            if tlsID in knownSignals:
+                self.simulation.trafficlight.subscribe(tlsID, TLS_VARIABLES)
+
+    def track(self, vehicleID):
+        # Routes do not change during our runs (no rerouting devices), they are read once per vehicle
+        self.simulation.vehicle.subscribe(vehicleID, self.vehicleVariables)
+        self.routes[vehicleID] = self.simulation.vehicle.getRoute(vehicleID)
+
+    def update(self, vehicleIDs):
+        # Call once per step after the vehicles were tracked, two batched reads cover every vehicle and signal
+        vehicleResults = self.simulation.vehicle.getAllSubscriptionResults()
+        tlsResults = self.simulation.trafficlight.getAllSubscriptionResults()
+        for vehicleID in [vehicleID for vehicleID in self.routes if vehicleID not in vehicleResults]:
+            del self.routes[vehicleID]
+
+        self.signals = {}
+        for vehicleID in vehicleIDs:
+            values = vehicleResults.get(vehicleID)
+            route = self.routes.get(vehicleID)
+            if values == None or route == None or tc.VAR_LANE_ID not in values:
+                continue
+            signal = self.findSignal(values[tc.VAR_LANE_ID], values[tc.VAR_LANEPOSITION], route, values[tc.VAR_ROUTE_INDEX])
+            if signal != None:
+                tlsID, linkIndex, distance = signal
+                state = tlsResults.get(tlsID, {}).get(tc.TL_RED_YELLOW_GREEN_STATE, "")
+                self.signals[vehicleID] = (tlsID, distance, state[linkIndex] if linkIndex < len(state) else None)
+        return self.signals
+
+    def findSignal(self, laneID, lanePosition, route, routeIndex):
+        # Walks the route ahead until the view distance is used up. Junction internal lanes are not
+        # counted on later junctions, they are a few metres at most.
+        distance = self.index.laneLength.get(laneID, 0.0) - lanePosition
+        nextEdge = route[routeIndex + 1] if routeIndex + 1 < len(route) else None
+        if not laneID.startswith(":"):
+            # Vehicles that still have to change lanes stop at the same signal as the right lane
+            link = self.index.laneLinks.get((laneID, nextEdge))
+            if link == None:
+                link = self.index.edgeLinks.get((route[routeIndex], nextEdge))
+            if link != None:
+                return (link[0], link[1], distance) if distance <= self.viewDistance else None
+
+        for edgeIdx in range(routeIndex + 1, len(route)):
+            if distance > self.viewDistance:
+                return None
+            edge = route[edgeIdx]
+            nextEdge = route[edgeIdx + 1] if edgeIdx + 1 < len(route) else None
+            distance = distance + self.index.edgeLength.get(edge, 0.0)
+            link = self.index.edgeLinks.get((edge, nextEdge))
+            if link != None:
+                return (link[0], link[1], distance) if distance <= self.viewDistance else None
+        return None
+
+
+def readSignalPrograms(programFileName):
+    # tls id to its programID and phases as (duration, state, minDur, maxDur), minDur/maxDur are None for fixed phases
+    programs = {}
+    for tlLogic in ET.parse(programFileName).getroot().iter('tlLogic'):
+        phases = []
+        for phase in tlLogic.iter('phase'):
+            minDuration = phase.get('minDur')
+            maxDuration = phase.get('maxDur')
+            phases.append((float(phase.get('duration')), phase.get('state'),
+                           float(minDuration) if minDuration != None else None,
+                           float(maxDuration) if maxDuration != None else None))
+        programs[tlLogic.get('id')] = (tlLogic.get('programID'), phases)
+    return programs
+
+
+def returnAdditionalOptions(configFileName, programFileName):
+    # --additional-files on the command line replaces the config's list, keep the config's files (polygons) in it
+    configDirectory = os.path.dirname(configFileName)
+    additional = ET.parse(configFileName).getroot().find('input').find('additional-files')
+    fileNames = []
+    if additional != None:
+        fileNames = [os.path.join(configDirectory, name.strip()) for name in additional.get('value').split(",") if name.strip() != ""]
+    return ["--additional-files", ",".join(fileNames + [programFileName])]
+
+
+class AdaptiveSignalController:
+    def __init__(self, simulation, programFileName, timestep, occupancyThreshold=10.0):
+        # Extends a green phase while its lanes still discharge and cuts it once they are empty and another
+        # approach queues, always within the minDur/maxDur of the program. Phases without bounds (yellow,
+        # all red) run as programmed. Lanes and signals are subscribed once, every step is two batched reads.
+        self.simulation = simulation
+        self.timestep = timestep
+        self.occupancyThreshold = occupancyThreshold
+        self.programs = {}
+        # tls id to the incoming lane of every link index
+        self.linkLanes = {}
+        # tls id to [current phase, seconds spent in it]
+        self.phaseTimes = {}
+        knownSignals = set(self.simulation.trafficlight.getIDList())
+        subscribedLanes = set()
+        for tlsID, (programID, phases) in readSignalPrograms(programFileName).items():
+            if tlsID not in knownSignals:
+                print ( "Signal not in the network ", tlsID )
+                continue
+            if not self.selectProgram(tlsID, programID, phases):
+                continue
+            self.programs[tlsID] = phases
+            self.linkLanes[tlsID] = self.simulation.trafficlight.getControlledLanes(tlsID)
+            self.phaseTimes[tlsID] = [None, 0.0]
+            self.simulation.trafficlight.subscribe(tlsID, TLS_VARIABLES)
+            for laneID in set(self.linkLanes[tlsID]) - subscribedLanes:
+                self.simulation.lane.subscribe(laneID, LANE_VARIABLES)
+                subscribedLanes.add(laneID)
+
+    def selectProgram(self, tlsID, programID, phases):
+        # The file may share its programID with the net's own program, so adapt a signal only when the logic
+        # SUMO runs under that id has the file's phases, phase indices are only meaningful then
+        states = [phase[1] for phase in phases]
+        for logic in self.simulation.trafficlight.getAllProgramLogics(tlsID):
+            if logic.programID != programID:
+                continue
+            if [phase.state for phase in logic.phases] != states:
+                print ( "Signal program ", programID, " differs from the file, not adapted ", tlsID )
+                return False
+            if self.simulation.trafficlight.getProgram(tlsID) != programID:
+                self.simulation.trafficlight.setProgram(tlsID, programID)
+            return True
+        print ( "Signal program ", programID, " not loaded, not adapted ", tlsID )
+        return False
+
+    def update(self):
+        # Call once per step before simulationStep
+        laneResults = self.simulation.lane.getAllSubscriptionResults()
+        tlsResults = self.simulation.trafficlight.getAllSubscriptionResults()
+        for tlsID, phases in self.programs.items():
+            values = tlsResults.get(tlsID)
+            if values == None:
+                continue
+            phase = values[tc.TL_CURRENT_PHASE]
+            phaseTime = self.phaseTimes[tlsID]
+            if phase != phaseTime[0]:
+                phaseTime[0] = phase
+                phaseTime[1] = self.timestep
+                if phase < len(phases) and phases[phase][3] != None:
+                    # SUMO would end the phase after its programmed duration, we decide up to maxDur
+                    self.simulation.trafficlight.setPhaseDuration(tlsID, phases[phase][3] - self.timestep)
+                continue
+            phaseTime[1] = phaseTime[1] + self.timestep
+            if phase >= len(phases) or phases[phase][2] == None:
+                continue
+            if self.cutPhase(tlsID, values[tc.TL_RED_YELLOW_GREEN_STATE], phases[phase], phaseTime[1], laneResults):
+                self.simulation.trafficlight.setPhase(tlsID, (phase + 1) % len(phases))
+
+    def cutPhase(self, tlsID, state, phase, elapsed, laneResults):
+        minDuration, maxDuration = phase[2], phase[3]
+        if elapsed < minDuration:
+            return False
+        if elapsed >= maxDuration:
+            return True
+        servedLanes = set()
+        waitingLanes = set()
+        for linkIndex, laneID in enumerate(self.linkLanes[tlsID]):
+            if linkIndex < len(state) and state[linkIndex] in "Gg":
+                servedLanes.add(laneID)
+            else:
+                waitingLanes.add(laneID)
+        waitingLanes = waitingLanes - servedLanes
+        servedQueue = 0
+        servedOccupancy = 0.0
+        for laneID in servedLanes:
+            values = laneResults.get(laneID, {})
+            servedQueue = servedQueue + values.get(tc.LAST_STEP_VEHICLE_HALTING_NUMBER, 0)
+            servedOccupancy = max(servedOccupancy, values.get(tc.LAST_STEP_OCCUPANCY, 0.0))
+        waitingQueue = sum([laneResults.get(laneID, {}).get(tc.LAST_STEP_VEHICLE_HALTING_NUMBER, 0) for laneID in waitingLanes])
+        # Gap out: nobody left to serve on green while another approach is queueing
+        return servedQueue == 0 and servedOccupancy < self.occupancyThreshold and waitingQueue > 0
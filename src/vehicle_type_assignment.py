@@ -0,0 +1,119 @@
+from filelock import FileLock
+import gzip
+import hashlib
+import json
+import os
+import random
+import xml.etree.ElementTree as ET
+import route_cache
+import xml_parser
+
+# Vehicle types run() switches vehicles to
+AV_TYPE = "AV_passenger"
+AV_CONSERVATIVE_TYPE = "AV_passenger_conservative"
+CAV_TYPE = "CAV_passenger"
+
+# Writing the typed routes takes seconds, a lock held longer belongs to a hung worker
+ASSIGNMENT_LOCK_TIMEOUT_SECONDS = 600
+
+
+def returnAssignedType(randomnum, avProbability, cavProbability, trafficSet):
+    # Same rule run() applies when it changes types over TraCI, None keeps the vehicle's own type
+    if (avProbability != 0) and (randomnum <= avProbability):
+        if trafficSet:
+            return AV_CONSERVATIVE_TYPE
+        return AV_TYPE
+    elif (cavProbability != 0) and (randomnum <= cavProbability):
+        return CAV_TYPE
+    return None
+
+
+class VehicleTypeAssignment:
+    def __init__(self, sourceFileNames, avProbability, cavProbability, trafficSet, seed=10, cacheDirectory=None):
+        # Writes copies of the route/trip files with the AV/CAV types already set, one per test configuration,
+        # so the run needs no setType calls. The same configuration and seed always give the same vehicles.
+        self.sourceFileNames = sourceFileNames
+        self.avProbability = avProbability
+        self.cavProbability = cavProbability
+        self.trafficSet = trafficSet
+        self.seed = seed
+        if cacheDirectory == None:
+            cacheDirectory = os.path.join(os.path.dirname(sourceFileNames[0]), "route_cache")
+        self.cacheDirectory = cacheDirectory
+        self.key = self.returnKey()
+        # Vehicle id to AV/CAV type, filled by prepare()
+        self.types = {}
+
+    def returnKey(self):
+        sha = hashlib.sha1()
+        for sourceFileName in self.sourceFileNames:
+            sha.update(route_cache.hashFile(sourceFileName).encode())
+        sha.update(",".join([str(self.avProbability), str(self.cavProbability), str(self.trafficSet), str(self.seed)]).encode())
+        return sha.hexdigest()[0:16]
+
+    def routeFileNames(self):
+        return [os.path.join(self.cacheDirectory, "typed_" + self.key + "_" + str(idx) + ".rou.xml.gz") for idx in range(len(self.sourceFileNames))]
+
+    def assignmentFileName(self):
+        return os.path.join(self.cacheDirectory, "typed_" + self.key + ".json")
+
+    def prepare(self):
+        # Returns the typed route files, writing them first if this configuration is new
+        if not os.path.exists(self.assignmentFileName()):
+            os.makedirs(self.cacheDirectory, exist_ok=True)
+            with FileLock(self.assignmentFileName() + ".lock", timeout=ASSIGNMENT_LOCK_TIMEOUT_SECONDS):
+                if not os.path.exists(self.assignmentFileName()):
+                    self.writeRouteFiles()
+        with open(self.assignmentFileName(), 'r') as file:
+            assignment = json.load(file)
+        self.types = {}
+        for vehicleType, vehicleIDs in assignment.items():
+            for vehicleID in vehicleIDs:
+                self.types[vehicleID] = vehicleType
+        return self.routeFileNames()
+
+    def writeRouteFiles(self):
+        generator = random.Random(self.seed)
+        assignment = {}
+        for sourceFileName, routeFileName in zip(self.sourceFileNames, self.routeFileNames()):
+            tempFileName = routeFileName + ".tmp"
+            with xml_parser.openOutputFile(sourceFileName) as source, gzip.open(tempFileName, 'wt') as target:
+                self.writeTypedRoutes(source, target, generator, assignment)
+            os.replace(tempFileName, routeFileName)
+
+        # Written last, its presence means the route files are complete
+        tempFileName = self.assignmentFileName() + ".tmp"
+        with open(tempFileName, 'w') as file:
+            json.dump(assignment, file)
+        os.replace(tempFileName, self.assignmentFileName())
+
+    def writeTypedRoutes(self, source, target, generator, assignment):
+        # Copies every top level element (vType, route, vehicle, trip, ...) in order, one at a time
+        depth = 0
+        root = None
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if root == None:
+                    root = elem
+                    target.write('<?xml version="1.0" encoding="UTF-8"?>\n<routes>\n')
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            if elem.tag in ['vehicle', 'trip']:
+                vehicleType = returnAssignedType(generator.random(), self.avProbability, self.cavProbability, self.trafficSet)
+                if vehicleType != None:
+                    elem.set('type', vehicleType)
+                    assignment.setdefault(vehicleType, []).append(elem.get('id'))
+            target.write('    ' + ET.tostring(elem, encoding='unicode').strip() + '\n')
+            elem.clear()
+            root.clear()
+        target.write('</routes>\n')
+
+    def returnType(self, vehicleID):
+        # AV/CAV type of a vehicle, copies made by --scale are named <id>.<n> and share the type of <id>
+        vehicleType = self.types.get(vehicleID)
+        if vehicleType == None and "." in vehicleID:
+            vehicleType = self.types.get(vehicleID.rsplit(".", 1)[0])
+        return vehicleType
@@ -0,0 +1,84 @@
+import contextlib
+import json
+import socket
+import threading
+import time
+
+# Worker progress is sent to the GUI as small UDP datagrams on localhost, nothing leaves the machine
+TELEMETRY_HOST = "127.0.0.1"
+# At most this many messages per second and worker
+TELEMETRY_RATE = 4.0
+# Seconds between heartbeats during a long step that has no simulation steps to count
+BUSY_HEARTBEAT_SECONDS = 5.0
+# Longest a block may keep the worker looking alive, past it the GUI's stall check takes over
+BUSY_LIMIT_SECONDS = 3600.0
+
+
+class TelemetryPublisher:
+    def __init__(self, port, worker, rate=TELEMETRY_RATE):
+        # Fire and forget, a GUI that is not listening (or a full socket buffer) never slows the simulation down
+        self.address = (TELEMETRY_HOST, port)
+        self.worker = worker
+        self.interval = 1.0 / rate
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.lastSendTime = 0.0
+        self.lastSendStep = 0
+        # Index of the test the worker is on, step counts restart with every test
+        self.runIndex = 0
+
+    def heartbeat(self, state, runIndex):
+        # Progress outside the simulation steps: "reading" the next test, "starting" SUMO, writing "results", "idle"
+        self.runIndex = runIndex
+        self.lastSendTime = 0.0
+        self.lastSendStep = 0
+        self.send({"worker": self.worker, "time": time.time(), "state": state, "run": runIndex, "step": 0})
+
+    @contextlib.contextmanager
+    def busy(self, state, runIndex, limit=BUSY_LIMIT_SECONDS):
+        # For steps that legitimately take long without simulation steps: routing the trips, waiting on the route
+        # cache lock while another worker routes, parsing a large tripinfo. A ticker keeps counting while the
+        # block runs so the GUI does not take it for a stall. Every wait inside needs its own timeout, the ticker
+        # stops after limit seconds anyway so a block that hangs regardless still shows up as a stall.
+        self.heartbeat(state, runIndex)
+        stop = threading.Event()
+
+        def tick():
+            count = 0
+            while (count + 1) * BUSY_HEARTBEAT_SECONDS <= limit and not stop.wait(BUSY_HEARTBEAT_SECONDS):
+                count = count + 1
+                self.send({"worker": self.worker, "time": time.time(), "state": state, "run": runIndex, "step": count})
+
+        ticker = threading.Thread(target=tick, daemon=True)
+        ticker.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            ticker.join()
+
+    def publish(self, step, simulatedTime, activeVehicles, etaSeconds, force=False):
+        now = time.time()
+        if not force and (now - self.lastSendTime) < self.interval:
+            return
+        # Steps per wall second since the previous message
+        stepRate = 0.0
+        if self.lastSendTime > 0 and now > self.lastSendTime and step >= self.lastSendStep:
+            stepRate = (step - self.lastSendStep) / (now - self.lastSendTime)
+        self.send({"worker": self.worker, "time": now, "state": "running", "run": self.runIndex, "step": step, "simulatedTime": simulatedTime,
+                   "activeVehicles": activeVehicles, "stepRate": stepRate, "eta": etaSeconds})
+        self.lastSendTime = now
+        self.lastSendStep = step
+
+    def send(self, message):
+        try:
+            self.socket.sendto(json.dumps(message).encode(), self.address)
+        except OSError:
+            pass
+
+
+def busy(telemetry, state, runIndex):
+    # TelemetryPublisher.busy when the worker has a publisher, nothing otherwise
+    if telemetry == None:
+        return contextlib.nullcontext()
+    return telemetry.busy(state, runIndex)
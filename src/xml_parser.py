@@ -1,4 +1,6 @@
 import xml.etree.ElementTree as ET
+import gzip
+import math
 import numpy
 
 
@@ -23,199 +25,439 @@ class SUMOXMLDataParser:
         self.averagefuel = 0.0
         self.averageelectricity = 0.0
 
+        # Percentiles from the quantile sketches, see PERCENTILE_FIELDS
+        for name in PERCENTILE_FIELDS:
+            setattr(self, name, 0.0)
+        # Sketch name to QuantileSketch, these merge across runs
+        self.sketches = {}
 
-class SUMOOutputParser:
-    def __init__(self, filenameTripInfo):
-        self.rootTripInfo = ET.parse(filenameTripInfo).getroot()
-        self.totalTimeLoss = 0
-        self.averageTimeLoss = 0
+        # Same statistics split by vehicle class, class name to SUMOXMLDataParser
+        self.vehicleClasses = {}
+
+
+def openOutputFile(filename):
+    # SUMO writes gzip compressed output when the file name ends in .gz
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
+
+
+def iterElements(filename, tag):
+    # Hand out one element at a time and throw it away afterwards so memory stays flat
+    # no matter how large the file is, compressed files are decompressed as we go
+    with openOutputFile(filename) as file:
+        context = ET.iterparse(file, events=('start', 'end'))
+        root = None
+        for event, elem in context:
+            if root == None:
+                root = elem
+            if event == 'end' and elem.tag == tag:
+                yield elem
+                elem.clear()
+                # The root still holds on to the emptied children, let them go
+                root.clear()
+
+
+# Attributes pulled out of every tripinfo element and its emissions child, in column order
+TRIPINFO_ATTRIBUTES = ['timeLoss', 'waitingTime', 'routeLength', 'duration']
+EMISSION_ATTRIBUTES = ['CO2_abs', 'CO_abs', 'HC_abs', 'NOx_abs', 'PMx_abs', 'fuel_abs', 'electricity_abs']
+
+# Fields of SUMOXMLDataParser in the order they are published
+RESULT_FIELDS = ["totalVehicles", "totalTimeLoss", "averageTimeLoss", "averageWaitingTime", "waitingTimeSTDDev",
+                 "totalWaitingTime", "averageSpeed", "noramlizedDurationSTDDev", "noramlizedDurationMean",
+                 "minTimeLoss", "maxTimeLoss", "averageco2", "averageco", "averagehc", "averagenox", "averagepmx",
+                 "averagefuel", "averageelectricity"]
+
+# Distributions we keep a quantile sketch of and the percentiles published from each
+SKETCH_ATTRIBUTES = ['timeLoss', 'waitingTime', 'noramlizedDuration']
+PERCENTILES = [50, 90, 99]
+PERCENTILE_FIELDS = [name + "P" + str(percentile) for name in SKETCH_ATTRIBUTES for percentile in PERCENTILES]
+
+# Vehicle types the runner assigns, every other vType (human drivers) is counted as default
+VEHICLE_CLASSES = ['default', 'AV_passenger', 'AV_passenger_conservative', 'CAV_passenger']
+
+
+def returnVehicleClass(vType):
+    if vType in VEHICLE_CLASSES:
+        return vType
+    return 'default'
+
+
+class RunningMoments:
+    def __init__(self):
+        # Running mean and population variance, merged a chunk at a time so we do not need to keep every value
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def addArray(self, values):
+        if len(values) == 0:
+            return
+        chunkCount = len(values)
+        chunkMean = numpy.mean(values, dtype=numpy.float64)
+        chunkM2 = numpy.sum((values - chunkMean) ** 2, dtype=numpy.float64)
+
+        # Chan et al. pairwise update
+        count = self.count + chunkCount
+        delta = chunkMean - self.mean
+        self.mean = self.mean + delta * chunkCount / count
+        self.m2 = self.m2 + chunkM2 + delta * delta * self.count * chunkCount / count
+        self.count = count
+
+    def std(self):
+        if self.count == 0:
+            return 0.0
+        return numpy.sqrt(self.m2 / self.count)
+
+
+class QuantileSketch:
+    def __init__(self, relativeAccuracy=0.01, maxBuckets=2048, state=None):
+        # Log bucketed histogram (DDSketch style), every quantile comes back within relativeAccuracy of
+        # the true value and two sketches merge by adding their bucket counts
+        if state != None:
+            relativeAccuracy = state["relativeAccuracy"]
+        self.relativeAccuracy = relativeAccuracy
+        self.maxBuckets = maxBuckets
+        self.gamma = (1 + relativeAccuracy) / (1 - relativeAccuracy)
+        self.logGamma = math.log(self.gamma)
+        # Values closer to zero than this are counted as zero
+        self.minValue = 1e-9
+        self.count = 0
+        self.zeroCount = 0
+        # Bucket index to count, bucket k holds magnitudes in (gamma^(k-1), gamma^k]
+        self.positive = {}
+        self.negative = {}
+        if state != None:
+            self.count = state["count"]
+            self.zeroCount = state["zeroCount"]
+            self.positive = {int(key): count for key, count in state["positive"].items()}
+            self.negative = {int(key): count for key, count in state["negative"].items()}
+
+    def addArray(self, values):
+        # inf/NaN (e.g. a normalized duration with zero free flow time) have no place in a distribution
+        values = values[numpy.isfinite(values)]
+        if len(values) == 0:
+            return
+        self.count = self.count + len(values)
+        self.zeroCount = self.zeroCount + int(numpy.count_nonzero(numpy.abs(values) <= self.minValue))
+        self.addMagnitudes(self.positive, values[values > self.minValue])
+        self.addMagnitudes(self.negative, -values[values < -self.minValue])
+
+    def addMagnitudes(self, buckets, magnitudes):
+        if len(magnitudes) == 0:
+            return
+        keys = numpy.ceil(numpy.log(magnitudes) / self.logGamma).astype(numpy.int64)
+        lowest = int(keys.min())
+        counts = numpy.bincount(keys - lowest)
+        for offset in numpy.flatnonzero(counts).tolist():
+            key = lowest + offset
+            buckets[key] = buckets.get(key, 0) + int(counts[offset])
+        self.collapse(buckets)
+
+    def collapse(self, buckets):
+        # Keep memory bounded by folding the smallest magnitudes together, the tail stays accurate
+        if len(buckets) <= self.maxBuckets:
+            return
+        keys = sorted(buckets)
+        excess = len(keys) - self.maxBuckets
+        target = keys[excess]
+        for key in keys[:excess]:
+            buckets[target] = buckets[target] + buckets.pop(key)
+
+    def merge(self, other):
+        if other.relativeAccuracy != self.relativeAccuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        self.count = self.count + other.count
+        self.zeroCount = self.zeroCount + other.zeroCount
+        for buckets, otherBuckets in [(self.positive, other.positive), (self.negative, other.negative)]:
+            for key, count in otherBuckets.items():
+                buckets[key] = buckets.get(key, 0) + count
+            self.collapse(buckets)
+
+    def bucketValue(self, key):
+        # Midpoint that keeps the relative error of the bucket within relativeAccuracy
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = 0
+        # Most negative first, then zero, then the positive values from small to large
+        for key in sorted(self.negative, reverse=True):
+            seen = seen + self.negative[key]
+            if seen > rank:
+                return -self.bucketValue(key)
+        seen = seen + self.zeroCount
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen = seen + self.positive[key]
+            if seen > rank:
+                return self.bucketValue(key)
+        return self.bucketValue(max(self.positive))
+
+    def state(self):
+        # JSON friendly, QuantileSketch(state=...) rebuilds it
+        return {"relativeAccuracy": self.relativeAccuracy, "count": self.count, "zeroCount": self.zeroCount,
+                "positive": {str(key): count for key, count in self.positive.items()},
+                "negative": {str(key): count for key, count in self.negative.items()}}
+
+
+class TripInfoColumns:
+    def __init__(self, capacity=65536):
+        # Fixed size typed arrays that are filled from the XML and handed off for stats when full,
+        # so a single pass never holds more than one chunk of vehicles
+        self.capacity = capacity
+        self.size = 0
+        self.columns = {}
+        for name in TRIPINFO_ATTRIBUTES + EMISSION_ATTRIBUTES:
+            self.columns[name] = numpy.empty(capacity, dtype=numpy.float64)
+
+        # Vehicle types are stored as codes into vTypeNames
+        self.vType = numpy.empty(capacity, dtype=numpy.int32)
+        self.vTypeNames = []
+        self.vTypeCodes = {}
+
+    def add(self, type_tag):
+        # Now we parse emissions, vehicles without an emissions child are left out of the emission averages
+        #CO2="9941.81" CO="146.64" HC="0.91" NOx="4.27" PMx="0.21"
+        emissions = type_tag.find('emissions')
+        if emissions != None:
+            emissionValues = [float(emissions.get(name)) for name in EMISSION_ATTRIBUTES]
+        else:
+            emissionValues = None
+        return self.addValues([float(type_tag.get(name)) for name in TRIPINFO_ATTRIBUTES], emissionValues, type_tag.get('vType'))
+
+    def addValues(self, tripValues, emissionValues, vType):
+        # Values in TRIPINFO_ATTRIBUTES / EMISSION_ATTRIBUTES order, returns True once the chunk is full
+        idx = self.size
+        for name, value in zip(TRIPINFO_ATTRIBUTES, tripValues):
+            self.columns[name][idx] = value
+        for nameIdx, name in enumerate(EMISSION_ATTRIBUTES):
+            self.columns[name][idx] = emissionValues[nameIdx] if emissionValues != None else numpy.nan
+
+        if vType not in self.vTypeCodes:
+            self.vTypeCodes[vType] = len(self.vTypeNames)
+            self.vTypeNames.append(vType)
+        self.vType[idx] = self.vTypeCodes[vType]
+
+        self.size = idx + 1
+        return self.size == self.capacity
+
+    def view(self, name, mask=None):
+        if mask is None:
+            return self.columns[name][:self.size]
+        return self.columns[name][:self.size][mask]
+
+    def classMasks(self):
+        # One boolean mask per vehicle class present in this chunk
+        codes = self.vType[:self.size]
+        masks = {}
+        for code, vType in enumerate(self.vTypeNames):
+            vehicleClass = returnVehicleClass(vType)
+            codeMask = codes == code
+            if vehicleClass in masks:
+                masks[vehicleClass] = masks[vehicleClass] | codeMask
+            else:
+                masks[vehicleClass] = codeMask
+        return masks
+
+    def clear(self):
+        self.size = 0
+
+
+class TripStatistics:
+    def __init__(self):
         self.totalVehicles = 0
-        self.totalWaitingTime = 0
-        self.averageWaitingTime = 0
-        self.routeLengthTotal = 0
-        self.routeDurationTotal = 0
-        self.totalAverageSpeed = 0
-        self.averageSpeed = 0
-        
-        self.totalco2 = 0
-        self.totalco = 0
-        self.totalhc = 0
-        self.totalnox = 0
-        self.totalpmx = 0
-        self.totalfuel = 0
-        self.totalelectricity = 0
-        
+        self.totals = {}
+        self.counts = {}
+        for name in TRIPINFO_ATTRIBUTES + EMISSION_ATTRIBUTES:
+            self.totals[name] = 0.0
+            self.counts[name] = 0
+        self.totalAverageSpeed = 0.0
+        self.timeLossMoments = RunningMoments()
+        self.noramlizedDurationMoments = RunningMoments()
         self.maxTimeLoss = 0
         self.minTimeLoss = 9999999
+        self.sketches = {}
+        for name in SKETCH_ATTRIBUTES:
+            self.sketches[name] = QuantileSketch()
+
+    def addChunk(self, chunk, mask=None):
+        # Everything here is vectorized over the vehicles in the chunk, mask picks a subset of them
+        size = chunk.size if mask is None else int(numpy.count_nonzero(mask))
+        if size == 0:
+            return
+        timeLoss = chunk.view('timeLoss', mask)
+        routeLength = chunk.view('routeLength', mask)
+        duration = chunk.view('duration', mask)
+
+        self.totalVehicles = self.totalVehicles + size
+        for name in TRIPINFO_ATTRIBUTES + EMISSION_ATTRIBUTES:
+            values = chunk.view(name, mask)
+            valid = ~numpy.isnan(values)
+            self.totals[name] = self.totals[name] + float(numpy.sum(values[valid], dtype=numpy.float64))
+            self.counts[name] = self.counts[name] + int(numpy.count_nonzero(valid))
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            self.totalAverageSpeed = self.totalAverageSpeed + float(numpy.sum(routeLength / duration, dtype=numpy.float64))
+            noramlizedDuration = duration / (duration - timeLoss)
+
+        # min/max time loss are reported on the normalized duration, negative values do not count as a min
+        # NaN (zero duration) would hide the chunk's maximum, so only finite values count
+        finite = noramlizedDuration[numpy.isfinite(noramlizedDuration)]
+        if len(finite) > 0:
+            self.maxTimeLoss = max(self.maxTimeLoss, float(numpy.max(finite)))
+        nonNegative = noramlizedDuration[noramlizedDuration >= 0]
+        if len(nonNegative) > 0:
+            self.minTimeLoss = min(self.minTimeLoss, float(numpy.min(nonNegative)))
+
+        self.timeLossMoments.addArray(timeLoss)
+        self.noramlizedDurationMoments.addArray(noramlizedDuration)
+
+        self.sketches['timeLoss'].addArray(timeLoss)
+        self.sketches['waitingTime'].addArray(chunk.view('waitingTime', mask))
+        self.sketches['noramlizedDuration'].addArray(noramlizedDuration)
+
+    def average(self, name):
+        if self.counts[name] == 0:
+            return 0.0
+        return self.totals[name] / self.counts[name]
+
+    def returnResult(self):
+        result = SUMOXMLDataParser()
+        result.totalVehicles = self.totalVehicles
+        result.sketches = self.sketches
+        if self.totalVehicles == 0:
+            return result
+        result.totalTimeLoss = self.totals['timeLoss']
+        result.averageTimeLoss = self.totals['timeLoss'] / self.totalVehicles
+        result.averageWaitingTime = self.totals['waitingTime'] / self.totalVehicles
+        result.waitingTimeSTDDev = float(self.timeLossMoments.std())
+        result.totalWaitingTime = self.totals['waitingTime']
+        result.averageSpeed = self.totalAverageSpeed / self.totalVehicles
+        result.noramlizedDurationSTDDev = float(self.noramlizedDurationMoments.std())
+        result.noramlizedDurationMean = float(self.noramlizedDurationMoments.mean)
+        result.minTimeLoss = self.minTimeLoss
+        result.maxTimeLoss = self.maxTimeLoss
+        result.averageco2 = self.average('CO2_abs')
+        result.averageco = self.average('CO_abs')
+        result.averagehc = self.average('HC_abs')
+        result.averagenox = self.average('NOx_abs')
+        result.averagepmx = self.average('PMx_abs')
+        result.averagefuel = self.average('fuel_abs')
+        result.averageelectricity = self.average('electricity_abs')
+        for name in SKETCH_ATTRIBUTES:
+            for percentile in PERCENTILES:
+                setattr(result, name + "P" + str(percentile), self.sketches[name].quantile(percentile / 100.0))
+        return result
+
+
+class TripAccumulator:
+    def __init__(self):
+        # Overall and per vehicle class statistics fed from one stream of finished trips,
+        # either tripinfo elements or values collected over TraCI
+        self.chunk = TripInfoColumns()
+        self.statistics = TripStatistics()
+        self.classStatistics = {}
+        for vehicleClass in VEHICLE_CLASSES:
+            self.classStatistics[vehicleClass] = TripStatistics()
+
+    def addElement(self, type_tag):
+        if self.chunk.add(type_tag):
+            self.flush()
 
-        self.header_array = ["totalVehicles", "totalTimeLoss", "averageTimeLoss", "averageWaitingTime", "waitingTimeSTDDev",
-                             "totalWaitingTime", "averageSpeed", "noramlizedDurationSTDDev", "noramlizedDurationMean",
-                             "minTimeLoss", "maxTimeLoss", "averageco", "averagehc", "averagenox", "averagepmx",
-                             "averagefuel", "averageelectricity"]
+    def addValues(self, tripValues, emissionValues, vType):
+        if self.chunk.addValues(tripValues, emissionValues, vType):
+            self.flush()
+
+    def flush(self):
+        self.statistics.addChunk(self.chunk)
+        for vehicleClass, mask in self.chunk.classMasks().items():
+            self.classStatistics[vehicleClass].addChunk(self.chunk, mask)
+        self.chunk.clear()
+
+    def returnResult(self):
+        self.flush()
+        result = self.statistics.returnResult()
+        for vehicleClass in VEHICLE_CLASSES:
+            result.vehicleClasses[vehicleClass] = self.classStatistics[vehicleClass].returnResult()
+        return result
+
+
+class SUMOOutputParser:
+    def __init__(self, filenameTripInfo):
+        self.filenameTripInfo = filenameTripInfo
+        # Filled by the single parse pass, both return formats come from it
+        self.result = None
+
+        self.header_array = RESULT_FIELDS + PERCENTILE_FIELDS
+
+    def parse(self):
+        if self.result != None:
+            return self.result
+
+        accumulator = TripAccumulator()
+        for type_tag in iterElements(self.filenameTripInfo, 'tripinfo'):
+            accumulator.addElement(type_tag)
+
+        self.result = accumulator.returnResult()
+        return self.result
 
     def returnParsedData(self):
-        waitingTimeList = []
-        noramlizedDurationList = []
-        for type_tag in self.rootTripInfo.findall('tripinfo'):
-            timeLoss = float(type_tag.get('timeLoss'))
-            waitingTime = float(type_tag.get('waitingTime'))
-            routeLength = float(type_tag.get('routeLength'))
-            duration = float(type_tag.get('duration'))
-            
-            # Now we parse emissions
-            #CO2="9941.81" CO="146.64" HC="0.91" NOx="4.27" PMx="0.21"
-            co2 = float(type_tag[0].get('CO2_abs'))
-            hc = float(type_tag[0].get('HC_abs'))
-            co = float(type_tag[0].get('CO_abs'))
-            nox = float(type_tag[0].get('NOx_abs'))
-            pmx = float(type_tag[0].get('PMx_abs'))
-            fuel = float(type_tag[0].get('fuel_abs'))
-            electricity = float(type_tag[0].get('electricity_abs'))
-
-            self.totalco2 = self.totalco2 + co2
-            self.totalco = self.totalco + hc
-            self.totalhc = self.totalhc + co
-            self.totalnox = self.totalnox + nox
-            self.totalpmx = self.totalpmx + pmx
-            self.totalfuel = self.totalfuel + fuel
-            self.totalelectricity = self.totalelectricity + electricity
-            
-            noramlizedDuration = duration/(duration-timeLoss)
-            if noramlizedDuration > self.maxTimeLoss:
-                self.maxTimeLoss = noramlizedDuration
-            if noramlizedDuration < self.minTimeLoss and noramlizedDuration >= 0:
-                self.minTimeLoss = noramlizedDuration
-            
-            self.totalVehicles = self.totalVehicles + 1
-            self.totalTimeLoss = self.totalTimeLoss + timeLoss
-            self.totalWaitingTime = self.totalWaitingTime + waitingTime
-            self.routeLengthTotal = self.routeLengthTotal + routeLength
-            self.routeDurationTotal = self.routeDurationTotal + duration
-            self.totalAverageSpeed = self.totalAverageSpeed + (routeLength/duration)
-            
-            waitingTimeList.append(timeLoss)
-            noramlizedDurationList.append(noramlizedDuration)
-            
-        self.averageTimeLoss = self.totalTimeLoss / self.totalVehicles
-        self.averageWaitingTime = self.totalWaitingTime / self.totalVehicles
-        self.averageSpeed = self.totalAverageSpeed / self.totalVehicles
-        
-        waitingTimeListNumpy = numpy.array(waitingTimeList)
-        waitingTimeSTDDev = numpy.std(waitingTimeListNumpy, ddof=0, dtype=numpy.float64)
-        
-        noramlizedDurationListNumpy = numpy.array(noramlizedDurationList)
-        noramlizedDurationSTDDev = numpy.std(noramlizedDurationListNumpy, ddof=0, dtype=numpy.float64)
-        noramlizedDurationMean = numpy.mean(noramlizedDurationListNumpy, dtype=numpy.float64)
-
-        averageco2 = self.totalco2/self.totalVehicles
-        averageco = self.totalco/self.totalVehicles
-        averagehc = self.totalhc/self.totalVehicles
-        averagenox = self.totalnox/self.totalVehicles
-        averagepmx = self.totalpmx/self.totalVehicles
-        averagefuel = self.totalfuel/self.totalVehicles
-        averageelectricity = self.totalelectricity/self.totalVehicles
-        
-        return str(self.totalVehicles) + "," + str(self.totalTimeLoss) + "," + str(self.averageTimeLoss) + "," + str(self.averageWaitingTime) + "," + str(waitingTimeSTDDev) + "," + str(self.totalWaitingTime) + "," + str(self.averageSpeed) + "," + str(noramlizedDurationSTDDev) + "," + str(noramlizedDurationMean) + "," + str(self.minTimeLoss) + "," + str(self.maxTimeLoss) + "," + str(averageco2) + "," + str(averageco) + "," + str(averagehc) + "," + str(averagenox) + "," + str(averagepmx) + "," + str(averagefuel) + "," + str(averageelectricity)
+        result = self.parse()
+        return ",".join([str(getattr(result, name)) for name in self.header_array])
 
     def returnParsedDataGoogleSheets(self):
-        waitingTimeList = []
-        noramlizedDurationList = []
-        for type_tag in self.rootTripInfo.findall('tripinfo'):
-            timeLoss = float(type_tag.get('timeLoss'))
-            waitingTime = float(type_tag.get('waitingTime'))
-            routeLength = float(type_tag.get('routeLength'))
-            duration = float(type_tag.get('duration'))
-            
-            # Now we parse emissions
-            #CO2="9941.81" CO="146.64" HC="0.91" NOx="4.27" PMx="0.21"
-            co2 = float(type_tag[0].get('CO2_abs'))
-            hc = float(type_tag[0].get('HC_abs'))
-            co = float(type_tag[0].get('CO_abs'))
-            nox = float(type_tag[0].get('NOx_abs'))
-            pmx = float(type_tag[0].get('PMx_abs'))
-            fuel = float(type_tag[0].get('fuel_abs'))
-            electricity = float(type_tag[0].get('electricity_abs'))
-
-            self.totalco2 = self.totalco2 + co2
-            self.totalco = self.totalco + hc
-            self.totalhc = self.totalhc + co
-            self.totalnox = self.totalnox + nox
-            self.totalpmx = self.totalpmx + pmx
-            self.totalfuel = self.totalfuel + fuel
-            self.totalelectricity = self.totalelectricity + electricity
-            
-            noramlizedDuration = duration/(duration-timeLoss)
-            if noramlizedDuration > self.maxTimeLoss:
-                self.maxTimeLoss = noramlizedDuration
-            if noramlizedDuration < self.minTimeLoss and noramlizedDuration >= 0:
-                self.minTimeLoss = noramlizedDuration
-            
-            self.totalVehicles = self.totalVehicles + 1
-            self.totalTimeLoss = self.totalTimeLoss + timeLoss
-            self.totalWaitingTime = self.totalWaitingTime + waitingTime
-            self.routeLengthTotal = self.routeLengthTotal + routeLength
-            self.routeDurationTotal = self.routeDurationTotal + duration
-            self.totalAverageSpeed = self.totalAverageSpeed + (routeLength/duration)
-            
-            waitingTimeList.append(timeLoss)
-            noramlizedDurationList.append(noramlizedDuration)
-            
-        self.averageTimeLoss = self.totalTimeLoss / self.totalVehicles
-        self.averageWaitingTime = self.totalWaitingTime / self.totalVehicles
-        self.averageSpeed = self.totalAverageSpeed / self.totalVehicles
-        
-        waitingTimeListNumpy = numpy.array(waitingTimeList)
-        waitingTimeSTDDev = numpy.std(waitingTimeListNumpy, ddof=0, dtype=numpy.float64)
-        
-        noramlizedDurationListNumpy = numpy.array(noramlizedDurationList)
-        noramlizedDurationSTDDev = numpy.std(noramlizedDurationListNumpy, ddof=0, dtype=numpy.float64)
-        noramlizedDurationMean = numpy.mean(noramlizedDurationListNumpy, dtype=numpy.float64)
-
-        averageco2 = self.totalco2/self.totalVehicles
-        averageco = self.totalco/self.totalVehicles
-        averagehc = self.totalhc/self.totalVehicles
-        averagenox = self.totalnox/self.totalVehicles
-        averagepmx = self.totalpmx/self.totalVehicles
-        averagefuel = self.totalfuel/self.totalVehicles
-        averageelectricity = self.totalelectricity/self.totalVehicles
-        
-        returnPacket = SUMOXMLDataParser()
-        returnPacket.totalVehicles = self.totalVehicles
-        returnPacket.totalTimeLoss = self.totalTimeLoss
-        returnPacket.averageTimeLoss = self.averageTimeLoss
-        returnPacket.averageWaitingTime = self.averageWaitingTime
-        returnPacket.waitingTimeSTDDev = waitingTimeSTDDev
-        returnPacket.totalWaitingTime = self.totalWaitingTime
-        returnPacket.averageSpeed = self.averageSpeed
-        returnPacket.noramlizedDurationSTDDev = noramlizedDurationSTDDev
-        returnPacket.noramlizedDurationMean = noramlizedDurationMean
-        returnPacket.minTimeLoss = self.minTimeLoss
-        returnPacket.maxTimeLoss = self.maxTimeLoss
-        returnPacket.averageco2 = averageco2
-        returnPacket.averageco = averageco
-        returnPacket.averagehc = averagehc
-        returnPacket.averagenox = averagenox
-        returnPacket.averagepmx = averagepmx
-        returnPacket.averagefuel = averagefuel
-        returnPacket.averageelectricity = averageelectricity
-
-        return returnPacket
+        return self.parse()
 
     def return_parsed_data_header(self):
         return self.header_array
 
 
 class CollisionOutputParser:
-    def __init__(self, filenameCollisions):
-        self.rootTripInfo = ET.parse(filenameCollisions).getroot()
+    def __init__(self, filenameCollisions, timeBucketSeconds=300):
+        self.filenameCollisions = filenameCollisions
+        self.timeBucketSeconds = timeBucketSeconds
+        self.parsed = False
         self.totalCollisions = 0
 
-    def returnParsedData(self):
-        for type_tag in self.rootTripInfo.findall('collision'):
+        # Collision counts by collision type, by lane and by time bucket (bucket start in seconds)
+        self.collisionsByType = {}
+        self.collisionsByLane = {}
+        self.collisionsByTimeBucket = {}
+
+    def parse(self):
+        # One streaming pass over the collision elements, nothing is kept but the counts
+        if self.parsed:
+            return
+        for type_tag in iterElements(self.filenameCollisions, 'collision'):
             self.totalCollisions += 1
 
+            collisionType = type_tag.get('type')
+            self.collisionsByType[collisionType] = self.collisionsByType.get(collisionType, 0) + 1
+
+            lane = type_tag.get('lane')
+            self.collisionsByLane[lane] = self.collisionsByLane.get(lane, 0) + 1
+
+            collisionTime = type_tag.get('time')
+            if collisionTime != None:
+                bucket = int(float(collisionTime) // self.timeBucketSeconds) * self.timeBucketSeconds
+                self.collisionsByTimeBucket[bucket] = self.collisionsByTimeBucket.get(bucket, 0) + 1
+        self.parsed = True
+
+    def returnParsedData(self):
+        self.parse()
         return self.totalCollisions
 
+    def returnParsedDataBreakdown(self):
+        self.parse()
+        return {"totalCollisions": self.totalCollisions,
+                "byType": self.collisionsByType,
+                "byLane": self.collisionsByLane,
+                "byTimeBucket": dict(sorted(self.collisionsByTimeBucket.items()))}
+
 # Usage example for calling from another file
 #sumoparser = SUMOOutputParser("../output/deleteme0simulation_tripinfo.xml")
 #print ( sumoparser.returnParsedData() )
\ No newline at end of file
@@ -0,0 +1,75 @@
+import csv
+import os
+from csv_queue_journal import CSVQueueJournal
+
+
+def writeSpec(fileName, tests, version=0):
+    # tests is a list of (map name, iterations), every other parameter is the same
+    rows = [["iterations"], ["map"], ["av"], ["cav"], ["scale"], ["timestep"], ["trafficSet"], ["logEmissions"], ["working"]]
+    for mapName, iterations in tests:
+        for row, value in zip(rows, [str(iterations), mapName, "0.1", "0.2", "1", "1", "0", "1", "0"]):
+            row.append(value)
+    with open(fileName, 'w', newline='') as file:
+        csv.writer(file).writerows(rows)
+    # Every version gets its own mtime, file systems with coarse timestamps would not tell quick edits apart
+    os.utime(fileName, (1000000000 + version, 1000000000 + version))
+
+
+def test_claims_of_other_workers_are_replayed(tmp_path):
+    specFileName = str(tmp_path / "spec.csv")
+    writeSpec(specFileName, [("a", 2), ("b", 1)])
+    first = CSVQueueJournal(specFileName)
+    second = CSVQueueJournal(specFileName)
+    assert first.claim(1, -1) == 1
+    assert second.claim(2, -1) == 1
+    assert first.claim(1, 1) == 2
+    assert second.claim(2, 1) == -1
+    assert second.remaining == [0, 0, 0]
+    assert second.working == [0, 0, 1]
+
+
+def test_partial_journal_line_is_dropped(tmp_path):
+    specFileName = str(tmp_path / "spec.csv")
+    writeSpec(specFileName, [("a", 3)])
+    worker = CSVQueueJournal(specFileName)
+    assert worker.claim(1, -1) == 1
+    # A worker died half way through its append
+    with open(worker.journalFileName(worker.generation), 'ab') as file:
+        file.write(b"claim,2,")
+
+    fresh = CSVQueueJournal(specFileName)
+    assert fresh.claim(3, -1) == 1
+    assert fresh.remaining == [0, 1]
+    with open(fresh.journalFileName(fresh.generation), 'rb') as file:
+        lines = file.read().decode().splitlines()
+    assert lines == ["claim,1,1", "claim,3,1"]
+
+
+def test_compaction_keeps_the_counters(tmp_path):
+    specFileName = str(tmp_path / "spec.csv")
+    writeSpec(specFileName, [("a", 5), ("b", 5)])
+    worker = CSVQueueJournal(specFileName, compactEvery=3)
+    other = CSVQueueJournal(specFileName, compactEvery=3)
+    previousIdx = -1
+    for run in range(4):
+        previousIdx = worker.claim(1, previousIdx)
+    assert worker.generation > 0
+    assert other.claim(2, -1) == 1
+    assert other.remaining == [0, 0, 5]
+    assert other.working == [0, 2, 0]
+
+
+def test_spec_edit_keeps_claimed_runs_of_duplicate_columns(tmp_path):
+    specFileName = str(tmp_path / "spec.csv")
+    writeSpec(specFileName, [("a", 2), ("a", 2), ("b", 1)])
+    worker = CSVQueueJournal(specFileName)
+    previousIdx = -1
+    for run in range(3):
+        previousIdx = worker.claim(1, previousIdx)
+    assert worker.remaining == [0, 0, 1, 1]
+
+    # A column is added by hand, the two identical columns must keep their own progress
+    writeSpec(specFileName, [("a", 2), ("a", 2), ("b", 1), ("c", 1)], version=1)
+    other = CSVQueueJournal(specFileName)
+    assert other.claim(2, -1) == 2
+    assert other.remaining == [0, 0, 0, 1, 1]
@@ -0,0 +1,21 @@
+import math
+import numpy
+import demand_generator
+
+
+def normalCdf(x):
+    return 0.5 * (1.0 + math.erf(x / math.sqrt(2.0)))
+
+
+def test_peak_profile_is_a_truncated_normal():
+    positions = numpy.linspace(0.0, 0.999, 1000)
+    fractions = demand_generator.departureFractions("peak", positions, None)
+    assert (numpy.diff(fractions) >= 0).all()
+    assert fractions[0] == 0.0
+    # One sigma past the middle of the window, three sigma map to half of it
+    low = normalCdf(-3.0)
+    high = normalCdf(3.0)
+    for sigma in [-2.0, 0.0, 1.0]:
+        position = (normalCdf(sigma) - low) / (high - low)
+        fraction = demand_generator.departureFractions("peak", numpy.array([position]), None)[0]
+        assert numpy.isclose(fraction, (sigma + 3.0) / 6.0, atol=1e-7)
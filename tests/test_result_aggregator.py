@@ -0,0 +1,58 @@
+import csv
+import math
+import random
+from result_aggregator import ResultAggregator, RunningStats
+
+
+def test_running_stats_match_a_single_pass():
+    generator = random.Random(3)
+    rows = [[generator.gauss(100.0, 15.0), generator.expovariate(0.1)] for run in range(500)]
+    stats = RunningStats()
+    for row in rows:
+        stats.update(row)
+
+    for column in range(2):
+        values = [row[column] for row in rows]
+        mean = sum(values) / len(values)
+        stdDev = math.sqrt(sum([(value - mean) ** 2 for value in values]) / (len(values) - 1))
+        assert math.isclose(stats.mean[column], mean, rel_tol=1e-12)
+        assert math.isclose(stats.stdDev()[column], stdDev, rel_tol=1e-9)
+        assert stats.min[column] == min(values)
+        assert stats.max[column] == max(values)
+
+
+def test_running_stats_survive_a_state_round_trip():
+    # Every run is folded into the state a different worker saved, it has to give the same result as one pass
+    rows = [[float(value), "xml data error" if value % 7 == 0 else float(value * value)] for value in range(1, 60)]
+    single = RunningStats()
+    for row in rows:
+        single.update(row)
+    stats = RunningStats()
+    for row in rows:
+        stats = RunningStats(stats.state())
+        stats.update(row)
+    assert stats.runs == single.runs
+    assert stats.count == single.count == [59, 51]
+    for column in range(2):
+        assert math.isclose(stats.mean[column], single.mean[column], rel_tol=1e-12)
+        assert math.isclose(stats.stdDev()[column], single.stdDev()[column], rel_tol=1e-12)
+
+
+def test_summary_blocks_are_padded_to_the_header(tmp_path):
+    aggregator = ResultAggregator(str(tmp_path / "running_stats.json"))
+    key = ["map", "0.1", "0.2", "1", "1", "0", "1"]
+    # A run without emissions has a shorter row than one with them
+    aggregator.update(key + ["10", "2"])
+    aggregator.update(["other"] + key[1:] + ["10", "2", "5", "7"])
+    summaryFileName = str(tmp_path / "summary.csv")
+    aggregator.writeSummaryFile(summaryFileName, None, 4)
+
+    with open(summaryFileName, 'r') as file:
+        rows = list(csv.reader(file))
+    for row in rows:
+        # 6 key columns, the run count, four blocks of 4 and the pooled percentiles
+        assert len(row) == 6 + 1 + 4 * 4 + len(aggregator.returnPooledPercentiles({}))
+    short = [row for row in rows if row[0] == "map"][0]
+    # mean, std dev, min and max of the first column each start a block of four
+    assert [short[7], short[11], short[15], short[19]] == ["10.0", "0.0", "10.0", "10.0"]
+    assert short[9:11] == ["", ""]
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import pytest
+
+os.environ.setdefault('SUMO_HOME', os.path.dirname(__file__))
+route_cache = pytest.importorskip("route_cache")
+
+
+def writeMap(directory):
+    (directory / "osm.net.xml").write_text("<net/>")
+    (directory / "osm.trips.xml").write_text("<routes/>")
+    (directory / "osm.sumocfg").write_text('<configuration><input><net-file value="osm.net.xml"/>'
+                                           '<route-files value="osm.trips.xml"/></input></configuration>')
+    return str(directory / "osm.sumocfg")
+
+
+def test_key_is_memoized_until_an_input_changes(tmp_path, monkeypatch):
+    configFileName = writeMap(tmp_path)
+    versionCalls = []
+
+    def run(args, **kwargs):
+        versionCalls.append(args)
+        return subprocess.CompletedProcess(args, 0, stdout="duarouter 1.0\n")
+
+    monkeypatch.setattr(route_cache, "checkBinary", lambda name: "duarouter-" + str(tmp_path))
+    monkeypatch.setattr(route_cache.subprocess, "run", run)
+    first = route_cache.RouteCache(configFileName).returnKey()
+    assert route_cache.RouteCache(configFileName).returnKey() == first
+    assert len(versionCalls) == 1
+
+    # Same path, new content and size: hashed again
+    (tmp_path / "osm.trips.xml").write_text("<routes><trip/></routes>")
+    assert route_cache.RouteCache(configFileName).returnKey() != first
+    assert len(versionCalls) == 1
+
+
+def test_a_held_lock_falls_back_to_routing_at_insertion(tmp_path, monkeypatch):
+    configFileName = writeMap(tmp_path)
+    monkeypatch.setattr(route_cache, "checkBinary", lambda name: "duarouter")
+    monkeypatch.setattr(route_cache.subprocess, "run", lambda args, **kwargs: subprocess.CompletedProcess(args, 0, stdout="duarouter 1.0\n"))
+    monkeypatch.setattr(route_cache, "LOCK_TIMEOUT_SECONDS", 0.1)
+    cache = route_cache.RouteCache(configFileName)
+    routeFileName = cache.routeFileName(cache.returnKey())
+    os.makedirs(cache.cacheDirectory)
+    # Another worker stuck while routing
+    with route_cache.FileLock(routeFileName + ".lock"):
+        assert route_cache.returnRouteFile(configFileName) == None
@@ -0,0 +1,58 @@
+import pytest
+
+traffic_lights = pytest.importorskip("traffic_lights")
+from traci._trafficlight import Logic, Phase  # noqa
+
+
+class FakeTrafficLight:
+    def __init__(self, logics, active):
+        self.logics = logics
+        self.active = dict(active)
+        self.subscribed = []
+
+    def getIDList(self):
+        return list(self.logics.keys())
+
+    def getAllProgramLogics(self, tlsID):
+        return self.logics[tlsID]
+
+    def getProgram(self, tlsID):
+        return self.active[tlsID]
+
+    def setProgram(self, tlsID, programID):
+        self.active[tlsID] = programID
+
+    def getControlledLanes(self, tlsID):
+        return [tlsID + "_0", tlsID + "_1"]
+
+    def subscribe(self, tlsID, variables):
+        self.subscribed.append(tlsID)
+
+
+class FakeLane:
+    def subscribe(self, laneID, variables):
+        pass
+
+
+class FakeSimulation:
+    def __init__(self, logics, active):
+        self.trafficlight = FakeTrafficLight(logics, active)
+        self.lane = FakeLane()
+
+
+def test_only_signals_running_the_file_phases_are_adapted(tmp_path):
+    programFileName = tmp_path / "tlsAdaptation.add.xml"
+    programFileName.write_text('<additional>'
+                               '<tlLogic id="same" programID="0"><phase duration="30" state="Gr" minDur="5" maxDur="50"/><phase duration="3" state="yr"/></tlLogic>'
+                               '<tlLogic id="other" programID="0"><phase duration="30" state="Gr" minDur="5" maxDur="50"/><phase duration="3" state="yr"/></tlLogic>'
+                               '<tlLogic id="separate" programID="adaptive"><phase duration="30" state="rG" minDur="5" maxDur="50"/><phase duration="3" state="ry"/></tlLogic>'
+                               '</additional>')
+    logics = {"same": [Logic("0", 0, 0, [Phase(30, "Gr"), Phase(3, "yr")])],
+              # The net's own program 0 has a different phase plan
+              "other": [Logic("0", 0, 0, [Phase(30, "Gr"), Phase(3, "yr"), Phase(30, "rG"), Phase(3, "ry")])],
+              "separate": [Logic("0", 0, 0, [Phase(30, "Gr")]), Logic("adaptive", 0, 0, [Phase(30, "rG"), Phase(3, "ry")])]}
+    simulation = FakeSimulation(logics, {"same": "0", "other": "0", "separate": "0"})
+    controller = traffic_lights.AdaptiveSignalController(simulation, str(programFileName), 1.0)
+    assert sorted(controller.programs.keys()) == ["same", "separate"]
+    assert simulation.trafficlight.active["separate"] == "adaptive"
+    assert sorted(simulation.trafficlight.subscribed) == ["same", "separate"]
@@ -0,0 +1,14 @@
+import time
+import worker_telemetry
+
+
+def test_busy_stops_heartbeating_after_its_limit(monkeypatch):
+    monkeypatch.setattr(worker_telemetry, "BUSY_HEARTBEAT_SECONDS", 0.01)
+    publisher = worker_telemetry.TelemetryPublisher(0, "worker")
+    messages = []
+    publisher.send = messages.append
+    with publisher.busy("starting", 3, limit=0.055):
+        time.sleep(0.3)
+    # The "starting" heartbeat and one tick per heartbeat interval within the limit, nothing for the hung rest
+    assert [message["step"] for message in messages] == [0, 1, 2, 3, 4, 5]
+    assert set([message["state"] for message in messages]) == set(["starting"])
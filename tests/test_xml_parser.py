@@ -0,0 +1,84 @@
+import gzip
+import numpy
+import xml_parser
+
+
+def test_running_moments_match_a_single_pass():
+    values = numpy.random.RandomState(5).lognormal(3.0, 1.0, 10007)
+    moments = xml_parser.RunningMoments()
+    # Uneven chunks, the way full TripInfoColumns chunks and the last partial one arrive
+    for start, end in [(0, 1), (1, 4096), (4096, 4097), (4097, 10007)]:
+        moments.addArray(values[start:end])
+    assert moments.count == len(values)
+    assert numpy.isclose(moments.mean, numpy.mean(values), rtol=1e-12)
+    assert numpy.isclose(moments.std(), numpy.std(values), rtol=1e-9)
+
+
+def test_max_time_loss_ignores_zero_durations():
+    accumulator = xml_parser.TripAccumulator()
+    accumulator.chunk = xml_parser.TripInfoColumns(capacity=2)
+    # timeLoss, waitingTime, routeLength, duration: the first vehicle has no duration (NaN normalized duration)
+    accumulator.addValues([0.0, 0.0, 0.0, 0.0], None, "default")
+    accumulator.addValues([30.0, 5.0, 100.0, 40.0], None, "default")
+    accumulator.addValues([10.0, 0.0, 100.0, 20.0], None, "default")
+    result = accumulator.returnResult()
+    # 40 / (40 - 30) from the first chunk, 20 / (20 - 10) from the second
+    assert result.maxTimeLoss == 4.0
+    assert result.minTimeLoss == 2.0
+
+
+def test_collision_breakdown_streams_a_gzip_file(tmp_path):
+    fileName = str(tmp_path / "crashinfo.xml.gz")
+    with gzip.open(fileName, 'wt') as file:
+        file.write('<collisions>\n')
+        for time, collisionType, lane in [(10.0, "collision", "a_0"), (299.0, "frontal", "a_0"), (300.0, "collision", "b_1")]:
+            file.write('  <collision time="%s" type="%s" lane="%s" collider="v1" victim="v2"/>\n' % (time, collisionType, lane))
+        file.write('</collisions>\n')
+
+    breakdown = xml_parser.CollisionOutputParser(fileName).returnParsedDataBreakdown()
+    assert breakdown["totalCollisions"] == 3
+    assert breakdown["byType"] == {"collision": 2, "frontal": 1}
+    assert breakdown["byLane"] == {"a_0": 2, "b_1": 1}
+    assert breakdown["byTimeBucket"] == {0: 2, 300: 1}
+
+
+def lowerQuantile(values, q):
+    ordered = numpy.sort(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def test_sketch_quantiles_within_one_percent():
+    values = numpy.random.RandomState(11).lognormal(3.0, 1.5, 50000)
+    sketch = xml_parser.QuantileSketch(0.01)
+    sketch.addArray(values)
+    for q in [0.01, 0.25, 0.5, 0.9, 0.99, 0.999]:
+        exact = lowerQuantile(values, q)
+        assert abs(sketch.quantile(q) - exact) <= 0.01 * exact
+
+
+def test_sketch_quantiles_with_zeros_and_negatives():
+    # Time loss can be slightly negative and waiting time is mostly zero
+    values = numpy.concatenate([numpy.zeros(3000), numpy.random.RandomState(2).normal(0.0, 50.0, 7000)])
+    sketch = xml_parser.QuantileSketch(0.01)
+    sketch.addArray(values)
+    for q in [0.05, 0.3, 0.5, 0.7, 0.95]:
+        exact = lowerQuantile(values, q)
+        assert abs(sketch.quantile(q) - exact) <= 0.01 * abs(exact)
+
+
+def test_merged_sketches_equal_one_sketch_over_all_runs():
+    generator = numpy.random.RandomState(7)
+    runs = [generator.exponential(40.0, size) for size in [10, 5000, 1234]]
+    single = xml_parser.QuantileSketch()
+    single.addArray(numpy.concatenate(runs))
+
+    merged = xml_parser.QuantileSketch()
+    for values in runs:
+        sketch = xml_parser.QuantileSketch()
+        sketch.addArray(values)
+        # Pooled sketches are kept as JSON state between runs
+        merged = xml_parser.QuantileSketch(state=merged.state())
+        merged.merge(xml_parser.QuantileSketch(state=sketch.state()))
+    assert merged.state() == single.state()
+    for q in [0.5, 0.9, 0.99]:
+        assert merged.quantile(q) == single.quantile(q)
@@ -2,26 +2,49 @@ from PyQt5.QtWidgets import *
 from PyQt5 import QtCore, QtWidgets
 from PyQt5.QtCore import QSize
 from PyQt5.QtGui import QColor
+from PyQt5.QtNetwork import QUdpSocket, QHostAddress
 import subprocess
 import sys
 from sys import executable
 from subprocess import *
 import time
 import os
-from timeloop import Timeloop
-from datetime import timedelta
+import threading
 import random
 import math
 import json
 
-tl = Timeloop()
-
 global mainWin
 
-@tl.job(interval=timedelta(seconds=1))
-def read_simulation_every_1s():
-    global mainWin
-    mainWin.checkStatus()
+# Seconds between starting two workers so they do not hit Sheets at the same time, and before a failed worker starts again
+LAUNCH_INTERVAL_SECONDS = 30
+RESTART_DELAY_SECONDS = 2
+# A worker failing again and again waits twice as long each time, up to the cap, and is given up after MAX_RESTARTS
+MAX_RESTART_DELAY_SECONDS = 900
+MAX_RESTARTS = 8
+
+# Exit codes of runner_atlas_simulation.py: all tests done, and -99 for a configuration error (no test name, no SUMO_HOME)
+EXIT_ALL_TESTS_DONE = 99
+EXIT_CONFIGURATION_ERROR = -99
+
+def isConfigurationError(rc):
+    # Windows reports -99 as 4294967197, POSIX as 157
+    return rc == EXIT_CONFIGURATION_ERROR or rc == (EXIT_CONFIGURATION_ERROR & 0xFFFFFFFF) or rc == (EXIT_CONFIGURATION_ERROR & 0xFF)
+
+# Default seconds without progress (see src/worker_telemetry.py) before a worker counts as hung, settings.json stall_threshold overrides it
+STALL_THRESHOLD_SECONDS = 300
+
+class WorkerWatcher(QtCore.QObject):
+    # Waits for every worker on its own thread, the signal delivers the exit code on the UI thread
+    # The exit code goes as object, a C int would turn 4294967197 into -99
+    finished = QtCore.pyqtSignal(int, int, object)
+
+    def watch(self, thread, generation, process):
+        waiter = threading.Thread(target=self.waitForExit, args=(thread, generation, process), daemon=True)
+        waiter.start()
+
+    def waitForExit(self, thread, generation, process):
+        self.finished.emit(thread, generation, process.wait())
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -30,15 +53,33 @@ class MainWindow(QMainWindow):
         
         # Store the launch information so that if we crash we can restart
         self.simulatorLaunchCode = []
-        
-        # Store the long term status of a thread
-        self.threadStatus = []
-        self.checkingblocked = True
+
+        # Incremented on every launch and kill of a worker so exits of replaced processes are ignored
+        self.generation = []
+        # Restarts of every worker since it last made progress, for the backoff
+        self.restarts = []
+        # Staggered launches and restarts that have not happened yet
+        self.launchTimers = []
+        # Port of every worker to its thread, workers send their progress with their port id
+        self.workerPorts = {}
+        # Last (state, test, step) every worker reported and when it changed
+        self.workerProgress = []
+        self.workerProgressTime = []
+        # Workers run from src/, the GUI itself never changes its directory
+        self.workerDirectory = os.path.join(os.getcwd(), 'src')
 
         self.mapNameText = 'default/'
         
         QMainWindow.__init__(self)
 
+        self.watcher = WorkerWatcher()
+        self.watcher.finished.connect(self.on_worker_finished)
+
+        # Live progress of the workers (see src/worker_telemetry.py), the system picks a free local port
+        self.telemetrySocket = QUdpSocket(self)
+        self.telemetrySocket.bind(QHostAddress.LocalHost, 0)
+        self.telemetrySocket.readyRead.connect(self.on_telemetry_received)
+
         self.setMinimumSize(QSize(320, 800))    
         self.setWindowTitle("SUMO TPDT GUI") 
         
@@ -229,6 +270,12 @@ class MainWindow(QMainWindow):
         self.lineTestName.setText(settings['output_file'])
         self.lineSpreadTestName.setText(settings['input_file'])
         self.threadMonitor = settings['thread_monitor']
+        self.stallThreshold = settings.get('stall_threshold', STALL_THRESHOLD_SECONDS)
+
+        # Restart workers whose heartbeats stop showing progress
+        self.stallTimer = QtCore.QTimer(self)
+        self.stallTimer.timeout.connect(self.checkStalls)
+        self.stallTimer.start(1000)
 
     def createTable(self):
         # Create table
@@ -314,8 +361,6 @@ class MainWindow(QMainWindow):
         # Create the output file name that we will reuse for all the results
         outputFiletime = time.strftime("%Y%m%d-%H%M%S")
         startPort = random.randint(12345,65535)
-    
-        os.chdir('src')
         
         popenArraySimulation = ['python', 'runner_atlas_simulation.py']
         popenArraySimulation.append('--mapname')
@@ -330,46 +375,41 @@ class MainWindow(QMainWindow):
         if len(self.lineSpreadTestName.text()) > 0:
             popenArraySimulation.append('--testname')
             popenArraySimulation.append(self.lineSpreadTestName.text())
+        if self.buttonTrafficControlEnabled.isChecked() and len(self.lineTFLDistance.text()) > 0:
+            popenArraySimulation.append('--tfl_distance')
+            popenArraySimulation.append(self.lineTFLDistance.text())
+        if self.buttonTrafficControlEnabled.isChecked():
+            popenArraySimulation.append('--adaptive_tls')
+        popenArraySimulation.append('--telemetry_port')
+        popenArraySimulation.append(str(self.telemetrySocket.localPort()))
         # For now we are just going to automatically set the port
-        if int(self.lineThreads.text()) == 1:
-            self.colorAccordingToResult(0, 1)
-            self.threadStatus = [0]
+        threads = int(self.lineThreads.text())
+        if threads == 1:
             popenArraySimulation.append('--portid')
             popenArraySimulation.append(str(startPort))
             popenArraySimulation.append('--thread_management_sheet')
             popenArraySimulation.append(str(self.threadMonitor))
-            self.simulationP.append(Popen(popenArraySimulation, creationflags=CREATE_NEW_CONSOLE))
-            self.simulatorLaunchCode.append(popenArraySimulation)
-            self.simulation.append(True)
-            print ( "spawning sim with opts: " )
-            print ( popenArraySimulation )
-        elif int(self.lineThreads.text()) > 1 and int(self.lineThreads.text()) < 257:
-            self.threadStatus = [0] * int(self.lineThreads.text())
+            self.addWorker(popenArraySimulation)
+            self.launchWorker(0)
+        elif threads > 1 and threads < 257:
             portcountertemp = startPort
-            for idx in range(int(self.lineThreads.text())):
-                self.colorAccordingToResult(idx, 1)
+            for idx in range(threads):
                 popenArraySimulationTemp = []
                 popenArraySimulationTemp.append('--thread_management_sheet')
                 popenArraySimulationTemp.append(str(self.threadMonitor))
                 popenArraySimulationTemp.append('--portid')
                 portcountertemp = portcountertemp + 1
                 popenArraySimulationTemp.append(str(portcountertemp))
-                self.simulationP.append(Popen(popenArraySimulation + popenArraySimulationTemp, creationflags=CREATE_NEW_CONSOLE))
-                self.simulatorLaunchCode.append(popenArraySimulation + popenArraySimulationTemp)
-                self.simulation.append(True)
-                print ( "spawning sim with opts: " )
-                print ( popenArraySimulation + popenArraySimulationTemp )
-                time.sleep(30) # give it some arbitrary time to sleep and finish
+                self.addWorker(popenArraySimulation + popenArraySimulationTemp)
+                # Started one after another without blocking the GUI
+                self.scheduleLaunch(idx, idx * LAUNCH_INTERVAL_SECONDS)
         else:
             alert = QMessageBox()
             alert.setText('1 - 256 threads must be set!')
             alert.exec_()
+            self.startButton.setEnabled(True)
             return
         
-        self.checkingblocked = False
-        
-        os.chdir('..')
-        
         # alert = QMessageBox()
         # alert.setText('Controller has been started!')
         # alert.exec_()
@@ -384,80 +424,138 @@ class MainWindow(QMainWindow):
         # Clear the watch queues
         self.simulation = []
         self.simulationP = []
+        self.simulatorLaunchCode = []
+        self.generation = []
+        self.restarts = []
+        self.workerPorts = {}
+        self.workerProgress = []
+        self.workerProgressTime = []
         
         # Declare the button pushable
         self.startButton.setEnabled(True)
-        
-    def markAsAlive(self, thread):
-        self.threadStatus[thread] = 0
-        
-    def addAndcheckMissCount(self, thread):
-        # Check the current time and add it as our time if there is none
-        checkTime = time.time()
-        if self.threadStatus[thread] == 0:
-            self.threadStatus[thread] = checkTime
-        
-        # Check if more than 15 minutes has past since we saw tht thread alive
-        if (checkTime - self.threadStatus[thread]) > 900:
-            self.checkingblocked = True
+
+    def addWorker(self, launchCode):
+        self.workerPorts[int(launchCode[launchCode.index('--portid') + 1])] = len(self.simulation)
+        self.simulatorLaunchCode.append(launchCode)
+        self.simulationP.append(None)
+        self.simulation.append(True)
+        self.generation.append(0)
+        self.restarts.append(0)
+        self.workerProgress.append(None)
+        self.workerProgressTime.append(0)
+
+    def scheduleLaunch(self, thread, delaySeconds):
+        timer = QtCore.QTimer(self)
+        timer.setSingleShot(True)
+        timer.timeout.connect(lambda: self.launchWorker(thread))
+        timer.start(int(delaySeconds * 1000))
+        self.launchTimers.append(timer)
+
+    def launchWorker(self, thread):
+        # Ended tests do not start anything anymore
+        if thread >= len(self.simulation) or self.simulation[thread] == False:
+            return
+        self.generation[thread] += 1
+        # Starting counts as progress, the first heartbeat follows within seconds
+        self.workerProgress[thread] = None
+        self.workerProgressTime[thread] = time.time()
+        self.colorAccordingToResult(thread, 1)
+        self.simulationP[thread] = Popen(self.simulatorLaunchCode[thread], cwd=self.workerDirectory, creationflags=CREATE_NEW_CONSOLE)
+        self.watcher.watch(thread, self.generation[thread], self.simulationP[thread])
+        print ( "spawning sim with opts: " )
+        print ( self.simulatorLaunchCode[thread] )
+
+    def on_worker_finished(self, thread, generation, rc):
+        # Exits of killed or replaced processes and of ended tests are not failures
+        if thread >= len(self.simulation) or generation != self.generation[thread] or self.simulation[thread] == False:
+            return
+        if rc == EXIT_ALL_TESTS_DONE:
+            self.colorAccordingToResult(thread, 2)
+            # Time to end this thread we are done!
+            self.simulation[thread] = False
+        elif isConfigurationError(rc):
+            # Starting it again would fail the same way
+            print ( " Thread ", thread, " stopped on a configuration error" )
+            self.colorAccordingToResult(thread, 3)
+            self.simulation[thread] = False
+        else:
+            self.colorAccordingToResult(thread, 0)
             self.endAndRestart(thread)
-            self.markAsAlive(thread)
-            self.checkingblocked = False
-        
-    def checkStatus(self):
-        if self.checkingblocked == False:
-            #print ( "st1s job current time : {}".format(time.ctime()) )
-            for thread, (sim, simp) in enumerate(zip(self.simulation, self.simulationP)):
-                if sim == True:
-                    if simp.poll() is None:
-                        #simulation = False
-                        #alert = QMessageBox()
-                        #alert.setText('Simulation has exited!')
-                        #alert.exec_()
-                        self.markAsAlive(thread)
-                        pass
-                    else:
-                        rc = simp.returncode
-                        #print (rc)
-                        if rc == 4294967197:
-                            self.colorAccordingToResult(int(thread), 3)
-                            self.addAndcheckMissCount(thread)
-                            #print ( " here 3 1 " )
-                        elif rc == 99:
-                            self.colorAccordingToResult(int(thread), 2)
-                            # Time to end this thread we are done!
-                            sim = False
-                        else:
-                            self.colorAccordingToResult(int(thread), 0)
-                            self.addAndcheckMissCount(thread)
-                            #print ( " here 0 1 " )
-        
+
+    def on_telemetry_received(self):
+        while self.telemetrySocket.hasPendingDatagrams():
+            datagram, host, port = self.telemetrySocket.readDatagram(self.telemetrySocket.pendingDatagramSize())
+            try:
+                message = json.loads(datagram.decode())
+                thread = self.workerPorts.get(message["worker"])
+            except (ValueError, KeyError, TypeError):
+                continue
+            if thread == None or self.simulation[thread] == False:
+                continue
+            progress = (message.get("state"), message.get("run"), message.get("step"))
+            if progress != self.workerProgress[thread]:
+                self.workerProgress[thread] = progress
+                self.workerProgressTime[thread] = time.time()
+            # A worker that simulates again is healthy, its next failure starts the backoff over
+            if message.get("state") == "running":
+                self.restarts[thread] = 0
+            self.showTelemetry(thread, message)
+
+    def checkStalls(self):
+        checkTime = time.time()
+        for thread in range(len(self.simulation)):
+            # Exited workers are handled by on_worker_finished and wait for their relaunch
+            if self.simulation[thread] == False or self.simulationP[thread] == None or self.simulationP[thread].poll() != None:
+                continue
+            # Waiting for new tests is not a stall
+            if self.workerProgress[thread] != None and self.workerProgress[thread][0] == "idle":
+                continue
+            if (checkTime - self.workerProgressTime[thread]) > self.stallThreshold:
+                print ( " No progress from thread ", thread, " for ", int(checkTime - self.workerProgressTime[thread]), " seconds" )
+                self.colorAccordingToResult(thread, 0)
+                # Give the kill time to land before this worker is checked again
+                self.workerProgressTime[thread] = checkTime
+                self.endAndRestart(thread)
+
+    def showTelemetry(self, thread, message):
+        item = self.tableWidget.item(math.floor(thread/3), thread%3)
+        if item == None:
+            return
+        if message.get("state") != "running":
+            item.setText("%d: %s" % (thread, message.get("state")))
+            return
+        eta = message.get("eta")
+        etaText = "-" if eta == None else str(int(round(eta/60))) + " min"
+        item.setText("%d: %.1f st/s t %d s\n%d veh ETA %s" % (thread, message.get("stepRate", 0.0), message.get("simulatedTime", 0),
+                                                             message.get("activeVehicles", 0), etaText))
+        self.tableWidget.resizeRowToContents(math.floor(thread/3))
+
+    def killWorker(self, thread):
+        self.generation[thread] += 1
+        simp = self.simulationP[thread]
+        if simp != None and simp.poll() is None:
+            subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=simp.pid))
+
     def kill_simulation(self):
-        for sim, simp in zip(self.simulation, self.simulationP):
-            if sim == True:
-                subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=simp.pid))
-                sim = False
+        for timer in self.launchTimers:
+            timer.stop()
+        self.launchTimers = []
+        for thread in range(len(self.simulation)):
+            if self.simulation[thread] == True:
+                self.simulation[thread] = False
+                self.killWorker(thread)
                 
     def endAndRestart(self, thread):
-        print ( " Restarting thread " , thread )
-        
-        os.chdir('src')
-    
-        # Check and end both simulator
-        self.simulation[thread] = False
-        subprocess.Popen("TASKKILL /F /PID {pid} /T".format(pid=self.simulationP[thread].pid))
-        
-        time.sleep(2)
-        
-        # Restart simulator
-        self.colorAccordingToResult(thread, 1)
-        self.simulationP[thread] = Popen(self.simulatorLaunchCode[thread], creationflags=CREATE_NEW_CONSOLE)
-        print ( self.simulatorLaunchCode[thread] )
-        time.sleep(30)
-        
-        os.chdir('..')
-
-        self.simulation[thread] = True
+        # End what is left of the worker (e.g. its SUMO) and start it again once that is gone
+        self.killWorker(thread)
+        if self.restarts[thread] >= MAX_RESTARTS:
+            print ( " Thread ", thread, " failed ", self.restarts[thread] + 1, " times in a row, giving up" )
+            self.simulation[thread] = False
+            return
+        delay = min(RESTART_DELAY_SECONDS * 2 ** self.restarts[thread], MAX_RESTART_DELAY_SECONDS)
+        self.restarts[thread] += 1
+        print ( " Restarting thread " , thread, " in ", delay, " seconds" )
+        self.scheduleLaunch(thread, delay)
             
     def closeEvent(self, event):
         # We are dead, kill everything that is open
@@ -470,6 +568,4 @@ if __name__ == "__main__":
     mainWin = MainWindow()
     mainWin.show()
     
-    tl.start(block=False)
-    
     sys.exit( app.exec_() )
\ No newline at end of file